@@ -11,4 +11,23 @@ DB_CONFIG = {
     "driver": os.getenv("DB_DRIVER")
 }
 
+# Tamaño máximo del pool de conexiones (services/db_connector)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Latencia objetivo (segundos) por lote insertado antes de frenar la carga (services/throttle)
+DB_TARGET_LATENCY = float(os.getenv("DB_TARGET_LATENCY", "2.0"))
+
 SHARED_FOLDER = os.getenv("SHARED_FOLDER")
+
+# Carpeta del índice local de claves de finance_mes (services/key_index)
+KEY_INDEX_DIR = os.getenv("KEY_INDEX_DIR", "cache/finance_mes_keys")
+
+# Caché de archivos ya leídos y limpiados (services/parse_cache); 0 MB la desactiva
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "cache/parsed")
+PARSE_CACHE_MAX_MB = float(os.getenv("PARSE_CACHE_MAX_MB", "2048"))
+
+# Informe JSON Lines con la conciliación de cada carga (services/reconcile)
+LOAD_REPORT_PATH = os.getenv("LOAD_REPORT_PATH", "logs/cargas.jsonl")
+
+# Filas por fetchmany en las lecturas de la BBDD (services/sql_reader)
+DB_FETCH_ARRAYSIZE = int(os.getenv("DB_FETCH_ARRAYSIZE", "10000"))
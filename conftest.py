@@ -0,0 +1,2 @@
+# Raíz del repositorio: pytest la añade a sys.path, así los tests importan `services` y los scripts
+# tanto con `pytest` como con `python -m pytest`.
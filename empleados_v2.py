@@ -1,15 +1,25 @@
+import json
 import os
+import sys
 import pandas as pd
 import pyodbc
 from dotenv import load_dotenv
 from datetime import datetime
-from services.db_connector import get_connection
+from services.db_connector import session, print_pool_stats
+from services.bulk_writer import bulk_insert, create_temp_copy
+from services.xlsx_reader import is_xlsx, read_xlsx
+from services.parse_cache import file_digest
+from services.sql_reader import fetch_frame
 
 # Cargar variables de entorno
 load_dotenv()
-EXCEL_PATH = os.getenv("EMPLEADOS_EXCEL_PATH").strip('"')
+EXCEL_PATH = (os.getenv("EMPLEADOS_EXCEL_PATH") or "").strip('"')
 LOG_PATH    = "logs/empleados_update.log"
 TABLE_NAME  = "empleados_finance"
+SNAPSHOT_PATH = "cache/empleados_snapshot.json"
+
+# Columnas cuyo cambio cuenta como actualización de un empleado
+HASH_COLUMNS = ["NIF_CAPADO", "SAP_Tienda", "Nombre"]
 
 # Columnas esperadas y su mapeo
 COLUMNS_MAP = {
@@ -42,7 +52,11 @@ def write_log_date(date_str):
 
 def read_excel_data(path):
     """Lee y procesa los datos del archivo Excel."""
-    df = pd.read_excel(path, dtype=str)
+    if is_xlsx(path):
+        # Solo se leen las columnas necesarias, en streaming
+        df = read_xlsx(path, columns=list(COLUMNS_MAP), as_str=True)
+    else:
+        df = pd.read_excel(path, dtype=str)
     # Seleccionar y renombrar solo las columnas necesarias
     df = df[list(COLUMNS_MAP.keys())]
     df = df.rename(columns=COLUMNS_MAP)
@@ -52,114 +66,229 @@ def read_excel_data(path):
     return df
 
 
-def read_sql_data():
-    """Lee todos los empleados actuales de la base de datos."""
-    conn = get_connection()
+def read_sql_data(conn):
+    """Lee todos los empleados actuales de la base de datos (con la conexión de quien llama)."""
     cursor = conn.cursor()
     query = f"SELECT SAP, NIF_CAPADO, SAP_Tienda, Nombre FROM {TABLE_NAME}"
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    columnas = [column[0] for column in cursor.description]
-    data = [dict(zip(columnas, row)) for row in rows]
-    conn.close()
-    return pd.DataFrame(data)
+    df = fetch_frame(cursor, query, nombre=TABLE_NAME)
+    cursor.close()
+    return df
 
 
-def sync_empleados():
-    """Sincroniza los datos de empleados del Excel con la base de datos."""
-    current_file_date = get_file_modification_date(EXCEL_PATH)
-    last_logged_date = read_log_date()
+def row_hashes(df):
+    """SAP → hash (hex) de NIF_CAPADO/SAP_Tienda/Nombre de cada empleado."""
+    if df.empty:
+        return {}
+    datos = df[HASH_COLUMNS].fillna("").astype(str)
+    hashes = pd.util.hash_pandas_object(datos, index=False).to_numpy()
+    return dict(zip(df["SAP"].astype(str), (format(h, "016x") for h in hashes)))
 
-    if current_file_date == last_logged_date:
-        print("⏸️ El archivo no ha cambiado desde la última ejecución. No se actualiza.")
-        return
 
-    print("📥 Cargando datos desde Excel...")
-    excel_df = read_excel_data(EXCEL_PATH)
+def server_stats(conn):
+    """Recuento y checksum de la tabla: si no cambian, la instantánea sigue siendo válida."""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT COUNT(*), CHECKSUM_AGG(BINARY_CHECKSUM(SAP, NIF_CAPADO, SAP_Tienda, Nombre))
+        FROM {TABLE_NAME}
+    """)
+    filas, checksum = cursor.fetchone()
+    cursor.close()
+    return [filas, checksum]
+
+
+def read_snapshot():
+    """Instantánea de la última sincronización: hash del archivo, agregados de la tabla y hash por SAP."""
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    with open(SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_snapshot(file_hash, stats, hashes):
+    os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+    tmp = SNAPSHOT_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"archivo": file_hash, "bbdd": stats, "filas": hashes}, f)
+    os.replace(tmp, SNAPSHOT_PATH)
 
-    print("📤 Cargando datos actuales desde base de datos...")
-    db_df = read_sql_data()
 
-    conn = get_connection()
+def compute_delta(excel_df, excel_hashes, base_hashes):
+    """
+    Compara los hashes del Excel con los del estado de partida (instantánea o BBDD).
+    Devuelve (nuevos, eliminados, updates): DataFrames del Excel y la Serie de SAP a borrar.
+    """
+    saps = excel_df["SAP"].astype(str)
+    previo = saps.map(base_hashes)
+    actual = saps.map(excel_hashes)
+    nuevos = excel_df[previo.isna()]
+    updates = excel_df[previo.notna() & (previo != actual)]
+    en_excel = set(excel_hashes)
+    eliminados = pd.Series([sap for sap in base_hashes if sap not in en_excel], dtype=str)
+    return nuevos, eliminados, updates
+
+
+def apply_delta(conn, nuevos, eliminados, updates):
+    """Aplica bajas, cambios y altas sobre la tabla."""
     cursor = conn.cursor()
 
-    # DataFrames para almacenar los cambios
-    nuevos = pd.DataFrame()
-    eliminados = pd.Series(dtype=str)
-    updates = pd.DataFrame()
+    if not eliminados.empty:
+        print(f"🗑️ Eliminando {len(eliminados)} registros obsoletos...")
+        sql_delete = f"DELETE FROM {TABLE_NAME} WHERE SAP = ?"
+        cursor.executemany(sql_delete, [(sap,) for sap in eliminados])
+        conn.commit()
+
+    if not updates.empty:
+        print(f"🔁 Actualizando {len(updates)} registros (NIF_CAPADO, SAP_Tienda y/o Nombre cambiados)...")
+        sql_update = f"""
+            UPDATE {TABLE_NAME}
+            SET NIF_CAPADO = ?, SAP_Tienda = ?, Nombre = ?
+            WHERE SAP = ?
+        """
+        update_data = list(zip(updates["NIF_CAPADO"], updates["SAP_Tienda"], updates["Nombre"], updates["SAP"]))
+        cursor.executemany(sql_update, update_data)
+        conn.commit()
 
-    if db_df.empty:
-        print("⚠️ La tabla en la base de datos está vacía. Se insertarán todos los registros del Excel.")
-        nuevos = excel_df.copy()
-    else:
-        # --- 1. Detectar NUEVOS registros ---
-        # Empleados que están en el Excel pero no en la BBDD
-        merged_new = pd.merge(excel_df, db_df, on="SAP", how="left", indicator=True)
-        nuevos_saps = merged_new[merged_new["_merge"] == "left_only"]["SAP"]
-        nuevos = excel_df[excel_df["SAP"].isin(nuevos_saps)]
-
-        # --- 2. Detectar registros ELIMINADOS ---
-        # Empleados que están en la BBDD pero ya no en el Excel
-        merged_del = pd.merge(db_df, excel_df, on="SAP", how="left", indicator=True)
-        eliminados = merged_del[merged_del["_merge"] == "left_only"]["SAP"]
-        if not eliminados.empty:
-            print(f"🗑️ Eliminando {len(eliminados)} registros obsoletos...")
-            # Usar executemany para una operación más eficiente
-            sql_delete = f"DELETE FROM {TABLE_NAME} WHERE SAP = ?"
-            cursor.executemany(sql_delete, eliminados.tolist())
-            conn.commit()
-
-        # --- 3. Detectar y preparar ACTUALIZACIONES ---
-        # Comparamos empleados que existen en ambas fuentes
-        merged_update = pd.merge(excel_df, db_df, on="SAP", how="inner", suffixes=('', '_db'))
-        
-        # Filtrar si NIF_CAPADO o SAP_Tienda han cambiado
-        updates = merged_update[
-            (merged_update["NIF_CAPADO"] != merged_update["NIF_CAPADO_db"]) |
-            (merged_update["SAP_Tienda"] != merged_update["SAP_Tienda_db"])
-        ]
-        
-        if not updates.empty:
-            print(f"🔁 Actualizando {len(updates)} registros (NIF_CAPADO y/o SAP_Tienda cambiados)...")
-            sql_update = f"""
-                UPDATE {TABLE_NAME}
-                SET NIF_CAPADO = ?, SAP_Tienda = ?
-                WHERE SAP = ?
-            """
-            update_data = [
-                (row["NIF_CAPADO"], row["SAP_Tienda"], row["SAP"])
-                for _, row in updates.iterrows()
-            ]
-            cursor.executemany(sql_update, update_data)
-            conn.commit()
-
-    # --- 4. Insertar los NUEVOS registros ---
     if not nuevos.empty:
         print(f"➕ Insertando {len(nuevos)} registros nuevos...")
         sql_insert = f"""
             INSERT INTO {TABLE_NAME} (SAP, NIF_CAPADO, SAP_Tienda, Nombre)
             VALUES (?, ?, ?, ?)
         """
-        insert_data = [
-            (row["SAP"], row["NIF_CAPADO"], row["SAP_Tienda"], row["Nombre"])
-            for _, row in nuevos.iterrows()
-        ]
+        insert_data = list(zip(nuevos["SAP"], nuevos["NIF_CAPADO"], nuevos["SAP_Tienda"], nuevos["Nombre"]))
         cursor.executemany(sql_insert, insert_data)
         conn.commit()
 
     cursor.close()
-    conn.close()
-    
-    # Actualizar el log con la fecha del archivo procesado
+
+
+def merge_empleados(conn, excel_df, batch_size=5000):
+    """
+    Sube el Excel limpio a una tabla temporal y aplica un único MERGE por SAP: alta de los
+    nuevos, cambio de NIF_CAPADO/SAP_Tienda/Nombre y baja de los que ya no están.
+    Al ser una sola sentencia, quien lea la tabla nunca ve un estado a medias.
+    Los recuentos salen del OUTPUT.
+    """
+    columnas = ["SAP"] + HASH_COLUMNS
+    cursor = conn.cursor()
+    staging = create_temp_copy(cursor, conn, "empleados_staging", TABLE_NAME, columnas)
+    bulk_insert(staging, columnas, excel_df, conn=conn, batch_size=batch_size)
+
+    distinto = " OR ".join(
+        f"target.{c} <> source.{c}"
+        f" OR (target.{c} IS NULL AND source.{c} IS NOT NULL)"
+        f" OR (target.{c} IS NOT NULL AND source.{c} IS NULL)"
+        for c in HASH_COLUMNS
+    )
+    try:
+        cursor.execute(f"""
+            SET NOCOUNT ON;
+            DECLARE @cambios TABLE (accion NVARCHAR(10));
+
+            MERGE {TABLE_NAME} AS target
+            USING {staging} AS source
+            ON target.SAP = source.SAP
+            WHEN MATCHED AND ({distinto}) THEN
+                UPDATE SET {", ".join(f"{c} = source.{c}" for c in HASH_COLUMNS)}
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT ({", ".join(columnas)})
+                VALUES ({", ".join(f"source.{c}" for c in columnas)})
+            WHEN NOT MATCHED BY SOURCE THEN
+                DELETE
+            OUTPUT $action INTO @cambios;
+
+            SELECT
+                COALESCE(SUM(CASE WHEN accion = 'INSERT' THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN accion = 'UPDATE' THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN accion = 'DELETE' THEN 1 ELSE 0 END), 0)
+            FROM @cambios;
+        """)
+        insertados, actualizados, eliminados = cursor.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        conn.commit()
+        cursor.close()
+
+    return {"insertados": insertados, "actualizados": actualizados, "eliminados": eliminados}
+
+
+def sync_empleados(merge=False):
+    """
+    Sincroniza los datos de empleados del Excel con la base de datos.
+
+    Con el contenido del archivo sin cambios (mismo hash que la instantánea) no se lee el
+    Excel ni se consulta la BBDD. Si cambia, el delta se calcula contra la instantánea
+    de hashes por SAP; solo si falta o la tabla se ha modificado por otra vía (recuento
+    o checksum distintos) se descarga la tabla completa.
+
+    Con merge=True no se calcula el delta en Python: se aplica un único MERGE desde
+    una tabla temporal (ver merge_empleados).
+    """
+    current_file_date = get_file_modification_date(EXCEL_PATH)
+    last_logged_date = read_log_date()
+
+    if current_file_date == last_logged_date:
+        print("⏸️ El archivo no ha cambiado desde la última ejecución. No se actualiza.")
+        return
+
+    file_hash = file_digest(EXCEL_PATH)
+    snapshot = read_snapshot()
+    if snapshot is not None and snapshot["archivo"] == file_hash:
+        print("⏸️ El contenido del archivo no ha cambiado (solo la fecha). No se actualiza.")
+        write_log_date(current_file_date)
+        return
+
+    print("📥 Cargando datos desde Excel...")
+    excel_df = read_excel_data(EXCEL_PATH)
+    if excel_df.empty:
+        # Un Excel vacío dejaría la tabla sin empleados
+        print("❌ El Excel no contiene empleados. No se actualiza la tabla.")
+        return
+    duplicados = excel_df["SAP"].duplicated(keep="last")
+    if duplicados.any():
+        print(f"⚠️ {int(duplicados.sum())} SAP repetidos en el Excel; se conserva la última fila de cada uno.")
+        excel_df = excel_df[~duplicados]
+    excel_hashes = row_hashes(excel_df)
+
+    with session() as conn:
+        if merge:
+            print("🔀 Aplicando MERGE desde tabla temporal...")
+            resultado = merge_empleados(conn, excel_df)
+        else:
+            stats = server_stats(conn)
+
+            if snapshot is not None and snapshot["bbdd"] == stats:
+                print("🗂️ Calculando cambios contra la instantánea local (sin leer la tabla)...")
+                base_hashes = snapshot["filas"]
+            else:
+                print("📤 Cargando datos actuales desde base de datos (instantánea inexistente o desactualizada)...")
+                db_df = read_sql_data(conn)
+                base_hashes = row_hashes(db_df)
+                if db_df.empty:
+                    print("⚠️ La tabla en la base de datos está vacía. Se insertarán todos los registros del Excel.")
+
+            nuevos, eliminados, updates = compute_delta(excel_df, excel_hashes, base_hashes)
+            apply_delta(conn, nuevos, eliminados, updates)
+            resultado = {"insertados": len(nuevos), "actualizados": len(updates), "eliminados": len(eliminados)}
+
+        stats = server_stats(conn)
+
+    # Guardar la instantánea y actualizar el log con la fecha del archivo procesado
+    write_snapshot(file_hash, stats, excel_hashes)
     write_log_date(current_file_date)
 
     # Imprimir resumen final
     print("\n📊 Resumen de la sincronización:")
-    print(f"   ➕ Insertados:   {len(nuevos)}")
-    print(f"   🗑️ Eliminados:   {len(eliminados)}")
-    print(f"   🔁 Actualizados: {len(updates)}")
+    print(f"   ➕ Insertados:   {resultado['insertados']}")
+    print(f"   🗑️ Eliminados:   {resultado['eliminados']}")
+    print(f"   🔁 Actualizados: {resultado['actualizados']}")
     print("✅ Sincronización completada. Log actualizado.")
+    print_pool_stats()
+    return resultado
 
 
 if __name__ == "__main__":
-    sync_empleados()
\ No newline at end of file
+    sync_empleados(merge="--merge" in sys.argv)
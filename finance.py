@@ -0,0 +1,193 @@
+"""
+Punto de entrada único de las cargas:
+
+    python finance.py [--timings] <mes|base|historial|doble|objetivos|produccion|empleados|recalcular> [opciones]
+
+Antes de importar pandas/pyodbc y el script de la carga se hace una comprobación
+barata (solo os y variables de entorno): si no hay nada que procesar se sale sin más.
+"""
+import time
+
+INICIO = time.perf_counter()
+
+import argparse
+import importlib
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EXTENSIONES_MES = ('.csv', '.xls', '.xlsx')            # services/file_reader.get_excel_or_csv_files
+EXTENSIONES_BASE = ('.xlsx', '.xls', '.csv')           # proceso_base.VALID_EXTENSIONS
+EXTENSIONES_OBJETIVOS = ('.xlsx', '.xls')              # objetivos.get_objetivos_files
+EMPLEADOS_LOG = "logs/empleados_update.log"            # empleados_v2.LOG_PATH
+
+
+def _env_path(nombre):
+    return (os.getenv(nombre) or "").strip('"')
+
+
+def _hay_archivos(carpeta, extensiones):
+    if not carpeta or not os.path.isdir(carpeta):
+        return False
+    with os.scandir(carpeta) as entradas:
+        return any(e.is_file() and e.name.lower().endswith(extensiones) for e in entradas)
+
+
+# --- Comprobaciones previas: devuelven un motivo si no hay nada que hacer ---
+
+def _sin_trabajo_mes(args):
+    if not _hay_archivos(_env_path("SHARED_FOLDER"), EXTENSIONES_MES):
+        return "📭 No se encontraron archivos para procesar en la carpeta compartida."
+
+
+def _sin_trabajo_base(args):
+    if not _env_path("PROCESO_BASE_FOLDER"):
+        return "❌ La variable de entorno PROCESO_BASE_FOLDER no está definida."
+    if not _hay_archivos(_env_path("PROCESO_BASE_FOLDER"), EXTENSIONES_BASE):
+        return "📭 No se encontraron archivos para procesar."
+
+
+def _sin_trabajo_objetivos(args):
+    if not _env_path("OBJETIVOS_FOLDER"):
+        return "❌ La variable de entorno OBJETIVOS_FOLDER no está definida."
+    if not _hay_archivos(_env_path("OBJETIVOS_FOLDER"), EXTENSIONES_OBJETIVOS):
+        return "📭 No se encontraron archivos .xlsx/.xls para procesar."
+
+
+def _sin_trabajo_produccion(args):
+    if not _env_path("PRODUCCION_EXCEL_PATH"):
+        return "❌ La variable de entorno PRODUCCION_EXCEL_PATH no está definida."
+
+
+def _sin_trabajo_empleados(args):
+    ruta = _env_path("EMPLEADOS_EXCEL_PATH")
+    if not ruta:
+        return "❌ La variable de entorno EMPLEADOS_EXCEL_PATH no está definida."
+    if not os.path.exists(EMPLEADOS_LOG):
+        return None
+    with open(EMPLEADOS_LOG, "r") as f:
+        ultima = f.read().strip()
+    actual = datetime.fromtimestamp(os.path.getmtime(ruta)).strftime('%Y-%m-%d %H:%M:%S')
+    if actual == ultima:
+        return "⏸️ El archivo no ha cambiado desde la última ejecución. No se actualiza."
+
+
+# --- Ejecución de cada carga (los imports pesados ocurren aquí) ---
+
+def _workers(args):
+    if args.workers is None:
+        return 1
+    if args.workers == 0:
+        from services.pipeline import default_workers
+        return default_workers()
+    return args.workers
+
+
+def _run_mes(modulo, args):
+    modulo.main(pipeline=args.pipeline, workers=_workers(args), dedup_servidor=args.dedup_servidor,
+                verificar_hash=args.verificar_hash, streaming=args.streaming)
+
+
+def _run_base(modulo, args):
+    modulo.main(pipeline=args.pipeline, workers=_workers(args), diff=args.diff)
+
+
+def _run_historial(modulo, args):
+    modulo.main(pipeline=args.pipeline, workers=_workers(args), paralelo=args.paralelo,
+                politica="reemplazar" if args.reemplazar else "omitir")
+
+
+def _run_main(modulo, args):
+    modulo.main()
+
+
+def _run_doble(modulo, args):
+    modulo.main(pipeline=args.pipeline, workers=_workers(args), diff=args.diff, paralelo=args.paralelo,
+                politica="reemplazar" if args.reemplazar else "omitir")
+
+
+def _run_recalcular(modulo, args):
+    modulo.main(tabla=args.tabla, desde=args.desde, hasta=args.hasta)
+
+
+def _sin_trabajo_nunca(args):
+    return None
+
+
+def _run_empleados(modulo, args):
+    modulo.sync_empleados(merge=args.merge)
+
+
+# subcomando → (módulo, comprobación previa, ejecución)
+COMANDOS = {
+    "mes": ("mes", _sin_trabajo_mes, _run_mes),
+    "base": ("proceso_base", _sin_trabajo_base, _run_base),
+    "historial": ("proceso_base_historial", _sin_trabajo_base, _run_historial),
+    "doble": ("proceso_base_doble", _sin_trabajo_base, _run_doble),
+    "objetivos": ("objetivos", _sin_trabajo_objetivos, _run_main),
+    "produccion": ("producción", _sin_trabajo_produccion, _run_main),
+    "empleados": ("empleados_v2", _sin_trabajo_empleados, _run_empleados),
+    "recalcular": ("recalcular_comisiones", _sin_trabajo_nunca, _run_recalcular),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="finance", description="Cargas de datos de finance.")
+    parser.add_argument("--timings", action="store_true", help="muestra el tiempo de importación y de ejecución")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    for nombre in COMANDOS:
+        p = sub.add_parser(nombre)
+        if nombre in ("mes", "base", "historial", "doble"):
+            p.add_argument("--pipeline", action="store_true", help="lee el archivo N+1 mientras se carga el N")
+            p.add_argument("--workers", type=int, nargs="?", const=0, default=None,
+                           help="procesos de lectura (sin número: uno por núcleo)")
+        if nombre in ("base", "doble"):
+            p.add_argument("--diff", action="store_true", help="aplica solo las filas que cambian en vez de recargar la tabla")
+        if nombre in ("historial", "doble"):
+            p.add_argument("--reemplazar", action="store_true", help="vuelve a cargar los meses que ya existen")
+            p.add_argument("--paralelo", type=int, default=1, help="meses cargados a la vez")
+        if nombre == "recalcular":
+            fecha = lambda v: datetime.strptime(v, "%Y-%m-%d").date()
+            p.add_argument("tabla", choices=["base", "historial"])
+            p.add_argument("--desde", type=fecha, help="AAAA-MM-DD (incluido); por defecto, la primera FECHA_ALTA")
+            p.add_argument("--hasta", type=fecha, help="AAAA-MM-DD (excluido); por defecto, tras la última FECHA_ALTA")
+        if nombre == "empleados":
+            p.add_argument("--merge", action="store_true", help="aplica el Excel con un único MERGE desde tabla temporal")
+        if nombre == "mes":
+            p.add_argument("--dedup-servidor", action="store_true")
+            p.add_argument("--verificar-hash", action="store_true")
+            p.add_argument("--streaming", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    modulo_nombre, sin_trabajo, ejecutar = COMANDOS[args.comando]
+
+    motivo = sin_trabajo(args)
+    if motivo:
+        print(motivo)
+        if args.timings:
+            print(f"⏱️ Sin trabajo: {(time.perf_counter() - INICIO) * 1000:.0f} ms en total.")
+        return
+
+    t0 = time.perf_counter()
+    modulo = importlib.import_module(modulo_nombre)
+    t_import = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ejecutar(modulo, args)
+    t_run = time.perf_counter() - t0
+
+    if args.timings:
+        print(f"⏱️ Importación de {modulo_nombre}: {t_import * 1000:.0f} ms | "
+              f"ejecución: {t_run:.2f} s | total: {time.perf_counter() - INICIO:.2f} s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,51 +1,131 @@
 ### url_test:
 
-from services.file_reader import get_excel_or_csv_files, read_file
-from services.db_connector import insert_records
-from services.deduplication import get_existing_keys, filter_new_records
+from services.file_reader import get_excel_or_csv_files, read_file, read_file_chunks
+from services.db_connector import insert_records, print_pool_stats, session, FINANCE_MES_COLUMNS
+from services.deduplication import (
+    filter_new_records, insert_new_records_server_side, ensure_dedup_index, verify_existing_server_side
+)
+from services.key_index import get_key_index
+from services.throttle import ThroughputController
+from services.pipeline import run_pipeline, iter_parsed, pipeline_args
 
 INPUT_FOLDER = 'finance_mes_import'
 
 import shutil
 import os
+import sys
+from functools import partial
 from config import SHARED_FOLDER
 
-def main():
+def leer_archivo(file_path):
+    print(f'📂 Procesando archivo: {file_path}')
+    return read_file(file_path)
+
+def confirmar_subida(n):
+    confirm = input(f"Se han detectado {n} registros nuevos. ¿Deseas subirlos? (s/n): ")
+    if confirm.lower() == 's':
+        return True
+    print("🚫 Inserción cancelada por el usuario.")
+    return False
+
+def mover_a_procesado(file_path):
+    # ➕ Mover archivo a carpeta mes_procesado/
+    destino_dir = os.path.join(os.path.dirname(file_path), "mes_procesado")
+    os.makedirs(destino_dir, exist_ok=True)
+    nombre_archivo = os.path.basename(file_path)
+    nuevo_path = os.path.join(destino_dir, nombre_archivo)
+    shutil.move(file_path, nuevo_path)
+    print(f"📦 Archivo movido a: {nuevo_path}")
+
+def cargar_archivo_servidor(file_path, records):
+    """Deduplica en la BBDD (anti-join contra una tabla temporal) en vez de descargar las claves."""
+    print(f'🧹 Filtrando registros duplicados en el servidor...')
+    with session() as conn:
+        insert_new_records_server_side(records, conn, FINANCE_MES_COLUMNS, confirm=confirmar_subida)
+    mover_a_procesado(file_path)
+
+def verificar_en_servidor(df):
+    with session() as conn:
+        return verify_existing_server_side(df, conn)
+
+def cargar_archivo(file_path, records, verificar=False):
+    print(f'🔍 Obteniendo claves existentes (índice local por AÑO/MES)...')
+    key_index = get_key_index()
+    existing_keys = key_index.existing_keys(records)
+
+    print(f'🧹 Filtrando registros duplicados...')
+    new_records = filter_new_records(records, existing_keys,
+                                     verify=verificar_en_servidor if verificar else None)
+
+    print(f'✅ {len(new_records)} registros nuevos encontrados. Insertando...')
+    if len(new_records):
+        if confirmar_subida(len(new_records)):
+            insert_records(new_records, batch_size=1000, controller=ThroughputController(batch_size=1000))
+            key_index.add(new_records)
+    else:
+        print("No hay registros nuevos para insertar.")
+    mover_a_procesado(file_path)
+
+def cargar_archivo_streaming(file_path, verificar=False):
+    """
+    Modo streaming: el archivo se lee por bloques y cada bloque pasa por la deduplicación
+    y el escritor antes de leer el siguiente, así que la memoria no depende del tamaño del archivo.
+    """
+    print(f'📂 Procesando archivo en streaming: {file_path}')
+    confirm = input(f"Se subirán por bloques los registros nuevos de {os.path.basename(file_path)}. ¿Continuar? (s/n): ")
+    if confirm.lower() != 's':
+        print("🚫 Inserción cancelada por el usuario.")
+        mover_a_procesado(file_path)
+        return
+
+    key_index = get_key_index()
+    controller = ThroughputController(batch_size=1000)
+    verify = verificar_en_servidor if verificar else None
+    bloques = read_file_chunks(file_path)
+    nuevos = (filter_new_records(bloque, key_index.existing_keys(bloque), verify=verify) for bloque in bloques)
+
+    total = 0
+    for bloque in nuevos:
+        if len(bloque):
+            insert_records(bloque, batch_size=controller.batch_size, controller=controller)
+            key_index.add(bloque)
+            total += len(bloque)
+    print(f'✅ {total} registros nuevos insertados desde {os.path.basename(file_path)}.')
+    mover_a_procesado(file_path)
+
+def main(pipeline=False, workers=1, dedup_servidor=False, verificar_hash=False, streaming=False):
     files = get_excel_or_csv_files(SHARED_FOLDER)
 
     if not files:
         print("📭 No se encontraron archivos para procesar en la carpeta compartida.")
         return
-    
-    for file_path in files:
-        print(f'📂 Procesando archivo: {file_path}')
-        records = read_file(file_path)
-
-        print(f'🔍 Obteniendo claves existentes de la base de datos...')
-        existing_keys = get_existing_keys()
-
-        print(f'🧹 Filtrando registros duplicados...')
-        new_records = filter_new_records(records, existing_keys)
-
-        print(f'✅ {len(new_records)} registros nuevos encontrados. Insertando...')
-        if new_records:
-            confirm = input(f"Se han detectado {len(new_records)} registros nuevos. ¿Deseas subirlos? (s/n): ")
-            if confirm.lower() == 's':
-                insert_records(new_records, batch_size=1000, pause_seconds=5)
-            else:
-                print("🚫 Inserción cancelada por el usuario.")
-        else:
-            print("No hay registros nuevos para insertar.")
-        # ➕ Mover archivo a carpeta mes_procesado/
-        destino_dir = os.path.join(os.path.dirname(file_path), "mes_procesado")
-        os.makedirs(destino_dir, exist_ok=True)
-        nombre_archivo = os.path.basename(file_path)
-        nuevo_path = os.path.join(destino_dir, nombre_archivo)
-        shutil.move(file_path, nuevo_path)
-        print(f"📦 Archivo movido a: {nuevo_path}")
-
-
-        #insert_records(new_records)
+
+    if streaming:
+        # 🌊 Lectura, deduplicación e inserción bloque a bloque (memoria acotada)
+        for file_path in files:
+            cargar_archivo_streaming(file_path, verificar=verificar_hash)
+        print_pool_stats()
+        return
+
+    cargar = partial(cargar_archivo, verificar=verificar_hash)
+    if dedup_servidor:
+        with session() as conn:
+            ensure_dedup_index(conn)
+        cargar = cargar_archivo_servidor
+
+    if pipeline:
+        # 🔀 El archivo N+1 se lee mientras se carga el N
+        run_pipeline(files, leer_archivo, cargar, workers=workers)
+    else:
+        for path, resultado, error in iter_parsed(files, leer_archivo, workers=workers):
+            if error is not None:
+                print(f"❌ Error leyendo {os.path.basename(path)}: {error}")
+                continue
+            cargar(path, resultado)
+
+    print_pool_stats()
 
 if __name__ == '__main__':
-    main()
+    pipeline, workers = pipeline_args(sys.argv[1:])
+    main(pipeline=pipeline, workers=workers, dedup_servidor='--dedup-servidor' in sys.argv,
+         verificar_hash='--verificar-hash' in sys.argv, streaming='--streaming' in sys.argv)
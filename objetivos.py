@@ -2,11 +2,15 @@ import os
 import shutil
 import pandas as pd
 from dotenv import load_dotenv
-from services.db_connector import get_connection
+from services.db_connector import session
+from services.bulk_writer import bulk_insert
+from services.xlsx_reader import is_xlsx, read_xlsx, sheet_names
+from services.schemas import OBJETIVOS, normalize_header, parse_frame
 
 # Cargar variables de entorno
 load_dotenv()
 OBJETIVOS_FOLDER = os.getenv("OBJETIVOS_FOLDER")
+TABLA_STAGING = "#trc_objetivos_staging"
 
 # Configuración de Pandas
 pd.set_option("display.max_columns", None)
@@ -20,26 +24,28 @@ def get_objetivos_files(folder_path):
     ])
 
 def read_hoja1(path):
-    xl = pd.ExcelFile(path)
-    hoja1 = [s for s in xl.sheet_names if s.strip().lower() == 'hoja1']
+    if is_xlsx(path):
+        hojas = sheet_names(path)
+    else:
+        xl = pd.ExcelFile(path)
+        hojas = xl.sheet_names
+    hoja1 = [s for s in hojas if s.strip().lower() == 'hoja1']
     if not hoja1:
         raise ValueError(f"No se encontró la hoja 'Hoja1' en el archivo {os.path.basename(path)}")
+    if is_xlsx(path):
+        return read_xlsx(path, sheet_name=hoja1[0], as_str=True)
     return xl.parse(hoja1[0], dtype=str)
 
 def fix_trc_objetivo(df):
     # Normalizamos los nombres de columnas
-    df.columns = [col.strip().upper().replace(" ", "_") for col in df.columns]
+    df.columns = normalize_header(OBJETIVOS, df.columns)
 
     if "TRC_OBJETIVO" not in df.columns:
         raise ValueError("No se encontró la columna 'TRC OBJETIVO' en el archivo.")
 
-    df["TRC_OBJETIVO"] = (
-    df["TRC_OBJETIVO"]
-    .str.replace("%", "", regex=False)
-    .str.replace(",", ".")
-    .astype(float)
-    .round(4)
-)
+    # '12,5%' → 12.5 en una sola pasada; un valor no convertible detiene la carga
+    tipado, _ = parse_frame(df, OBJETIVOS, nombre="Hoja1")
+    df["TRC_OBJETIVO"] = tipado["TRC_OBJETIVO"]
 
     return df
 
@@ -48,32 +54,58 @@ def validar_duplicados(df):
         raise ValueError("⚠️ Existen combinaciones duplicadas de SAP + MES en el archivo.")
     return df
 
-def subir_objetivos(df, tabla_destino="trc_objetivos", batch_size=500):
-    conn = get_connection()
-    cursor = conn.cursor()
-
+def subir_objetivos(df, tabla_destino="trc_objetivos", batch_size=5000):
+    """
+    Carga la hoja completa en una tabla temporal y aplica un único MERGE por (SAP, MES).
+    Las filas cuyo TRC_OBJETIVO no ha cambiado no se tocan; los recuentos salen del OUTPUT.
+    """
     total = len(df)
     print(f"🚀 Subiendo {total} registros a la tabla '{tabla_destino}'...")
 
-    for i in range(0, total, batch_size):
-        batch = df.iloc[i:i+batch_size]
-        for _, row in batch.iterrows():
-            cursor.execute(f"""
-                MERGE {tabla_destino} AS target
-                USING (SELECT ? AS SAP, ? AS MES) AS source
-                ON target.SAP = source.SAP AND target.MES = source.MES
-                WHEN MATCHED THEN
-                    UPDATE SET TRC_OBJETIVO = ?
-                WHEN NOT MATCHED THEN
-                    INSERT (SAP, MES, TRC_OBJETIVO)
-                    VALUES (?, ?, ?);
-            """, row["SAP"], row["MES"], row["TRC_OBJETIVO"],
-                 row["SAP"], row["MES"], row["TRC_OBJETIVO"])
+    with session() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            DROP TABLE IF EXISTS {TABLA_STAGING};
+            SELECT TOP 0 SAP, MES, TRC_OBJETIVO INTO {TABLA_STAGING} FROM {tabla_destino};
+        """)
+        bulk_insert(TABLA_STAGING, ["SAP", "MES", "TRC_OBJETIVO"], df, conn=conn, batch_size=batch_size)
+
+        cursor.execute(f"""
+            SET NOCOUNT ON;
+            DECLARE @cambios TABLE (accion NVARCHAR(10));
+
+            MERGE {tabla_destino} AS target
+            USING {TABLA_STAGING} AS source
+            ON target.SAP = source.SAP AND target.MES = source.MES
+            WHEN MATCHED AND (
+                target.TRC_OBJETIVO <> source.TRC_OBJETIVO
+                OR (target.TRC_OBJETIVO IS NULL AND source.TRC_OBJETIVO IS NOT NULL)
+                OR (target.TRC_OBJETIVO IS NOT NULL AND source.TRC_OBJETIVO IS NULL)
+            ) THEN
+                UPDATE SET TRC_OBJETIVO = source.TRC_OBJETIVO
+            WHEN NOT MATCHED THEN
+                INSERT (SAP, MES, TRC_OBJETIVO)
+                VALUES (source.SAP, source.MES, source.TRC_OBJETIVO)
+            OUTPUT $action INTO @cambios;
+
+            SELECT
+                COALESCE(SUM(CASE WHEN accion = 'INSERT' THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN accion = 'UPDATE' THEN 1 ELSE 0 END), 0)
+            FROM @cambios;
+        """)
+        insertados, actualizados = cursor.fetchone()
+        conn.commit()
+
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLA_STAGING}")
         conn.commit()
+        cursor.close()
 
-    cursor.close()
-    conn.close()
+    sin_cambios = total - insertados - actualizados
+    print(f"   ➕ Insertados:   {insertados}")
+    print(f"   🔁 Actualizados: {actualizados}")
+    print(f"   ⏸️ Sin cambios:  {sin_cambios}")
     print("✅ Subida completada.")
+    return {"insertados": insertados, "actualizados": actualizados, "sin_cambios": sin_cambios}
 
 def mover_a_completos(path):
     carpeta_destino = os.path.join(os.path.dirname(path), "completos")
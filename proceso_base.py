@@ -1,25 +1,42 @@
 import os
+import sys
 import pandas as pd
 from dotenv import load_dotenv
 import pyodbc
-from services.db_connector import get_connection
+from services.db_connector import session
+from services.bulk_writer import bulk_insert
+from services.pipeline import run_pipeline, iter_parsed, pipeline_args
+from services.xlsx_reader import is_xlsx, read_xlsx
+from services.parse_cache import cached_parse
+from services.comisiones import desdoblar_comisiones, fix_comisiones
+from services.row_ids import file_fingerprint, row_guids
+from services.diff_sync import sync_diff
+from services.reconcile import LoadStats, reconcile
+from functools import partial
 import math
-import uuid
 
 # Cargar .env
 load_dotenv()
-FOLDER_PATH = os.getenv("PROCESO_BASE_FOLDER").strip('"')
+FOLDER_PATH = (os.getenv("PROCESO_BASE_FOLDER") or "").strip('"')
 
 # Extensiones válidas
 VALID_EXTENSIONS = (".xlsx", ".xls", ".csv")
 
+# Versión de la cadena de transformación: cambiarla invalida la caché de lecturas
+PARSE_VERSION = "datos_normalizados-4"
+
+TABLA_DESTINO = "Datos_Normalizados"
+
+# Columnas de Datos_Normalizados en el orden de inserción
+COLUMNAS_DESTINO = [
+    'FECHA_ALTA', 'SAP', 'IND_PRIMERA_UTIL_INTERNA', 'FTCI', 'NUM_OPERACIONES',
+    'IMPORTE_NUMERICO', 'VENDEDOR', 'IMPORTE', 'FUENTE', 'indice', 'numPersonal', 'guid'
+]
+
 pd.set_option("display.width", None)
 pd.set_option("display.max_columns", None)
 
 
-def generar_guid():
-    return uuid.uuid4().hex[:12]  # Suficiente para 100k registros
-
 def get_files_from_folder(folder_path):
     return sorted([
         os.path.join(folder_path, f)
@@ -29,10 +46,12 @@ def get_files_from_folder(folder_path):
 
 def read_file_as_text(path):
     ext = os.path.splitext(path)[1].lower()
-    if ext in [".xlsx", ".xls"]:
+    if is_xlsx(path):
+        return read_xlsx(path, as_str=True)
+    elif ext == ".xls":
         return pd.read_excel(path, dtype=str)
     elif ext == ".csv":
-        return pd.read_csv(path, dtype=str, sep=';', encoding='utf-8', engine='python')
+        return pd.read_csv(path, dtype=str, sep=';', encoding='utf-8', engine='c')
     else:
         raise ValueError(f"Extensión de archivo no soportada: {ext}")
     
@@ -60,56 +79,6 @@ def fix_importe(df):
     df['IMPORTE'] = pd.to_numeric(df['IMPORTE'], errors='coerce').fillna(0).round(2)
     return df
 
-def fix_comisiones(df):
-    # Asegurarse de que IMPORTE está en float (por si acaso)
-    df['IMPORTE'] = pd.to_numeric(df['IMPORTE'], errors='coerce').fillna(0).round(2)
-
-    # Calcular 20% para com_COD_VEND -- Cambio a 0.40 pendiente de aprobar
-    
-    df['com_COD_VEND'] = (df['IMPORTE'] * 0.40).round(2)
-
-    # Calcular el resto para com_VEND_FIRMA
-    df['com_VEND_FIRMA'] = (df['IMPORTE'] - df['com_COD_VEND']).round(2)
-
-    return df
-
-def desdoblar_comisiones(df):
-    df['IMPORTE_NUMERICO'] = df['IMPORTE']  # conservar valor original
-
-
-    # Propagar el GUID en ambas mitades
-    # COD_VEND
-    cod_rows = df.copy()
-    cod_rows['FUENTE'] = 'COD_VEND'
-    cod_rows['IMPORTE'] = cod_rows['com_COD_VEND']
-    cod_rows['VENDEDOR'] = cod_rows['COD_VEND']
-    cod_rows['guid'] = df['guid']
-
-    
-    # VEND_FIRMA
-    firma_rows = df.copy()
-    firma_rows['FUENTE'] = 'VEND_FIRMA'
-    firma_rows['IMPORTE'] = firma_rows['com_VEND_FIRMA']
-    firma_rows['VENDEDOR'] = firma_rows['VEND_FIRMA']
-    firma_rows['guid'] = df['guid']
-
-    # Unir
-    df_final = pd.concat([cod_rows, firma_rows], ignore_index=True)
-
-    # numPersonal = últimos 5 caracteres de VENDEDOR
-    df_final['numPersonal'] = df_final['VENDEDOR']
-
-    # índice = SAP + VENDEDOR + numPersonal
-    df_final['indice'] = df_final['SAP'] + df_final['VENDEDOR']
-
-    # Eliminar columnas intermedias
-    df_final = df_final.drop(columns=[
-        'COD_VEND', 'VEND_FIRMA', 'com_COD_VEND', 'com_VEND_FIRMA', 'KPI', 'AÑO', 'MES','NOMBRE'
-    ], errors='ignore')
-    df_final = df_final.sort_values(by=['guid', 'FUENTE']).reset_index(drop=True)
-
-    return df_final
-
 def chequear_equilibrio(df):
     total_importe = df['IMPORTE'].sum()
     total_origen = df['IMPORTE_NUMERICO'].sum()
@@ -124,99 +93,134 @@ def chequear_equilibrio(df):
     else:
         print("❌ Error: las sumas no coinciden, revisar cálculo.")
 
-def subir_comisiones(df, tabla_destino, batch_size=500):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # 🔍 Totales locales
-    count_local = len(df)
-    sum_local = round(df['IMPORTE'].sum(), 2)
-
-    # 🔍 Totales en BBDD
-    cursor.execute(f"SELECT COUNT(*), SUM(IMPORTE) FROM {tabla_destino}")
-    count_db, sum_db = cursor.fetchone()
-    sum_db = round(sum_db or 0, 2)
+def subir_comisiones(df, tabla_destino, batch_size=500, diff=False):
+    """
+    Sube el archivo si la tabla no cuadra con él (COUNT y SUM(IMPORTE)).
+    Por defecto vacía la tabla y recarga; con diff=True aplica solo las altas,
+    cambios y bajas por (guid, FUENTE) (ver services/diff_sync).
+    """
+    with session() as conn:
+        cursor = conn.cursor()
+
+        # 🔍 Totales locales
+        count_local = len(df)
+        sum_local = round(df['IMPORTE'].sum(), 2)
+
+        # 🔍 Totales en BBDD
+        cursor.execute(f"SELECT COUNT(*), SUM(IMPORTE) FROM {tabla_destino}")
+        count_db, sum_db = cursor.fetchone()
+        sum_db = round(sum_db or 0, 2)
+
+        print(f"💾 En BBDD: {count_db} registros / {sum_db:.2f}")
+        print(f"📄 En local: {count_local} registros / {sum_local:.2f}")
+
+        if count_db == 0:
+            print("🚀 Subiendo registros nuevos...")
+        elif count_db != count_local or not math.isclose(sum_db, sum_local, abs_tol=0.10):
+            if diff:
+                print("⚠️ Inconsistencia detectada. Sincronizando solo las filas que cambian...")
+            else:
+                print("⚠️ Inconsistencia detectada. Borrando toda la tabla...")
+                cursor.execute(f"DELETE FROM {tabla_destino}")
+                conn.commit()
+        else:
+            print("✅ Los datos ya están cargados correctamente. No se sube nada.")
+            cursor.close()
+            return
+            # 🧹 Sanitizar NUM_OPERACIONES y demás campos numéricos
+        # Convertir NaN a cadenas vacías en campos texto obligatorios
+        for col in ['SAP', 'VENDEDOR', 'indice', 'numPersonal', 'FTCI']:
+            df[col] = df[col].fillna('').astype(str).str.strip()
+
+        # Para campos enteros obligatorios
+        df['IND_PRIMERA_UTIL_INTERNA'] = pd.to_numeric(df['IND_PRIMERA_UTIL_INTERNA'], errors='coerce').fillna(0).astype(int)
+            # Conversión y validación estricta
+        df['NUM_OPERACIONES'] = pd.to_numeric(df['NUM_OPERACIONES'], errors='coerce').fillna(0).astype(int)
+        df['IMPORTE_NUMERICO'] = pd.to_numeric(df['IMPORTE_NUMERICO'], errors='coerce').fillna(0).round(2)
+        df['IMPORTE'] = pd.to_numeric(df['IMPORTE'], errors='coerce').fillna(0).round(2)
+        if diff and count_db:
+            sync_diff(df, conn, tabla_destino, COLUMNAS_DESTINO, batch_size=batch_size)
+        else:
+            # Subida en bloques; la tabla estaba vacía, así que la conciliación abarca solo esta carga
+            stats = LoadStats(amount_column='IMPORTE')
+            bulk_insert(tabla_destino, COLUMNAS_DESTINO, df, conn=conn, batch_size=batch_size,
+                        row_fallback=True, stats=stats)
+            reconcile(conn, tabla_destino, stats, scope="carga completa")
+
+        print("✅ Subida finalizada.")
+        cursor.close()
 
-    print(f"💾 En BBDD: {count_db} registros / {sum_db:.2f}")
-    print(f"📄 En local: {count_local} registros / {sum_local:.2f}")
 
-    if count_db == 0:
-        print("🚀 Subiendo registros nuevos...")
-    elif count_db != count_local or not math.isclose(sum_db, sum_local, abs_tol=0.10):
-        print("⚠️ Inconsistencia detectada. Borrando toda la tabla...")
-        cursor.execute(f"DELETE FROM {tabla_destino}")
-        conn.commit()
-    else:
-        print("✅ Los datos ya están cargados correctamente. No se sube nada.")
-        cursor.close()
-        conn.close()
+def leer_y_limpiar(path):
+    """Lectura y limpieza comunes a Datos_Normalizados y a su historial (todo lo previo al reparto)."""
+    df_original = read_file_as_text(path)
+    df_original["guid"] = row_guids(df_original, path)
+    #print("✅ Archivo leído. Columnas detectadas:")
+    #print(df_original.columns.tolist())
+    df_original = fix_vend_firma(df_original)
+    print("🛠️ Fix aplicado: VEND_FIRMA completado si estaba vacío o era 0.")
+    df_original = fix_codigos_vacios(df_original)
+    df_original = fix_importe(df_original)
+    return df_original
+
+def repartir(df_original):
+    """Reparto de comisiones con la regla vigente de TABLA_DESTINO y desdoble en dos filas."""
+    df_original = fix_comisiones(df_original, TABLA_DESTINO)
+    #mostrar_tabla_completa(df_original, "fix COD_VEND y VEND_FIRMA vacíos")
+    #mostrar_tabla_completa(df_original, "fix VEND_FIRMA")
+    df_original = desdoblar_comisiones(df_original)
+    return df_original
+
+def transformar_archivo(path):
+    """Lee el archivo y aplica toda la cadena de transformaciones."""
+    return repartir(leer_y_limpiar(path))
+
+def preparar_archivo(path):
+    """
+    Etapa de lectura: lee y limpia el archivo (o reutiliza la caché si no ha cambiado).
+    El reparto se aplica después de la caché, para que un cambio en REGLAS_REPARTO se note siempre.
+    """
+    print(f"\n📂 Procesando archivo: {os.path.basename(path)}")
+    # Los guids salen del nombre del archivo (row_ids.file_fingerprint): el nombre también es clave de la caché
+    df_limpio = cached_parse(path, leer_y_limpiar, f"{PARSE_VERSION}-{file_fingerprint(path)}")
+    df_original = repartir(df_limpio)
+    chequear_equilibrio(df_original)
+    return df_original
+
+def cargar_archivo(path, df_original, diff=False):
+    """Sube el archivo ya transformado y lo mueve a procesados (etapa de escritura)."""
+    subir_comisiones(df_original, TABLA_DESTINO, batch_size=2000, diff=diff)
+    #mostrar_tabla_completa(df_original, "🔁 Desdoble de comisiones por COD_VEND y VEND_FIRMA")
+    # mostrar_tabla_completa(df_original, "fix VEND_FIRMA")
+    # Aquí comenzará el flujo de transformaciones posteriores...
+    # ✅ Mover archivo procesado
+    procesados_path = os.path.join(FOLDER_PATH, "procesados")
+    os.makedirs(procesados_path, exist_ok=True)
+    archivo_destino = os.path.join(procesados_path, os.path.basename(path))
+    os.rename(path, archivo_destino)
+    print(f"📁 Archivo movido a: {archivo_destino}")
+
+def main(pipeline=False, workers=1, diff=False):
+    if not FOLDER_PATH:
+        print("❌ La variable de entorno PROCESO_BASE_FOLDER no está definida.")
         return
-        # 🧹 Sanitizar NUM_OPERACIONES y demás campos numéricos
-    # Convertir NaN a cadenas vacías en campos texto obligatorios
-    for col in ['SAP', 'VENDEDOR', 'indice', 'numPersonal', 'FTCI']:
-        df[col] = df[col].fillna('').astype(str).str.strip()
 
-    # Para campos enteros obligatorios
-    df['IND_PRIMERA_UTIL_INTERNA'] = pd.to_numeric(df['IND_PRIMERA_UTIL_INTERNA'], errors='coerce').fillna(0).astype(int)
-        # Conversión y validación estricta
-    df['NUM_OPERACIONES'] = pd.to_numeric(df['NUM_OPERACIONES'], errors='coerce').fillna(0).astype(int)
-    df['IMPORTE_NUMERICO'] = pd.to_numeric(df['IMPORTE_NUMERICO'], errors='coerce').fillna(0).round(2)
-    df['IMPORTE'] = pd.to_numeric(df['IMPORTE'], errors='coerce').fillna(0).round(2)
-    # Subida en bloques
-    for i in range(0, count_local, batch_size):
-        batch = df.iloc[i:i+batch_size]
-        print(f"📦 Insertando registros {i+1} a {i+len(batch)}...")
-        for idx, row in batch.iterrows():
-            try:
-                cursor.execute(f"""
-                    INSERT INTO {tabla_destino} (
-                        FECHA_ALTA, SAP, IND_PRIMERA_UTIL_INTERNA, FTCI, NUM_OPERACIONES,
-                        IMPORTE_NUMERICO, VENDEDOR, IMPORTE, FUENTE, indice, numPersonal, guid
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, row['FECHA_ALTA'], row['SAP'], row['IND_PRIMERA_UTIL_INTERNA'], row['FTCI'],
-                    row['NUM_OPERACIONES'], row['IMPORTE_NUMERICO'], row['VENDEDOR'],
-                    row['IMPORTE'], row['FUENTE'], row['indice'], row['numPersonal'], row['guid'])
-            except Exception as e:
-                print(f"❌ Error en fila {idx}: {e}")
-                print(row.to_dict())
-        conn.commit()
-
-    print("✅ Subida finalizada.")
-    cursor.close()
-    conn.close()
-
-
-def main():
     files = get_files_from_folder(FOLDER_PATH)
     if not files:
         print("📭 No se encontraron archivos para procesar.")
         return
 
-    for path in files:
-        print(f"\n📂 Procesando archivo: {os.path.basename(path)}")
-        df_original = read_file_as_text(path)
-        df_original["guid"] = [generar_guid() for _ in range(len(df_original))]
-        #print("✅ Archivo leído. Columnas detectadas:")
-        #print(df_original.columns.tolist())
-        df_original = fix_vend_firma(df_original)
-        print("🛠️ Fix aplicado: VEND_FIRMA completado si estaba vacío o era 0.")
-        df_original = fix_codigos_vacios(df_original)
-        df_original = fix_importe(df_original)
-        df_original = fix_comisiones(df_original)
-        #mostrar_tabla_completa(df_original, "fix COD_VEND y VEND_FIRMA vacíos")
-        #mostrar_tabla_completa(df_original, "fix VEND_FIRMA")
-        df_original = desdoblar_comisiones(df_original)
-        chequear_equilibrio(df_original)
-        subir_comisiones(df_original, "Datos_Normalizados", batch_size=2000)
-        #mostrar_tabla_completa(df_original, "🔁 Desdoble de comisiones por COD_VEND y VEND_FIRMA")
-        # mostrar_tabla_completa(df_original, "fix VEND_FIRMA")
-        # Aquí comenzará el flujo de transformaciones posteriores...
-        # ✅ Mover archivo procesado
-        procesados_path = os.path.join(FOLDER_PATH, "procesados")
-        os.makedirs(procesados_path, exist_ok=True)
-        archivo_destino = os.path.join(procesados_path, os.path.basename(path))
-        os.rename(path, archivo_destino)
-        print(f"📁 Archivo movido a: {archivo_destino}")
+    cargar = partial(cargar_archivo, diff=diff)
+    if pipeline:
+        # 🔀 El archivo N+1 se transforma mientras se sube el N
+        run_pipeline(files, preparar_archivo, cargar, workers=workers)
+    else:
+        for path, resultado, error in iter_parsed(files, preparar_archivo, workers=workers):
+            if error is not None:
+                print(f"❌ Error leyendo {os.path.basename(path)}: {error}")
+                continue
+            cargar(path, resultado)
 
 if __name__ == "__main__":
-    main()
+    pipeline, workers = pipeline_args(sys.argv[1:])
+    main(pipeline=pipeline, workers=workers, diff="--diff" in sys.argv)
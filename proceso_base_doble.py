@@ -0,0 +1,107 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import proceso_base as base
+import proceso_base_historial as historial
+from config import DB_POOL_SIZE
+from services.comisiones import desdoblar_comisiones, fix_comisiones
+from services.parse_cache import cached_parse
+from services.row_ids import file_fingerprint
+from services.pipeline import run_pipeline, iter_parsed, pipeline_args
+
+# Carga única de cada archivo de PROCESO_BASE_FOLDER en Datos_Normalizados y en su historial:
+# se lee y limpia una vez y solo el reparto de comisiones (con la regla de cada tabla) va por separado.
+
+FOLDER_PATH = base.FOLDER_PATH
+
+# Versión de la lectura y limpieza comunes: cambiarla invalida la caché de lecturas
+PARSE_VERSION = "datos_normalizados_doble-2"
+
+TABLAS = (base.TABLA_DESTINO, historial.TABLA_DESTINO)
+
+
+def repartir(df_limpio):
+    """Desdobla el archivo ya limpio con la regla de reparto de cada tabla."""
+    return {tabla: desdoblar_comisiones(fix_comisiones(df_limpio.copy(), tabla)) for tabla in TABLAS}
+
+
+def preparar_archivo(path):
+    """
+    Etapa de lectura: lee y limpia el archivo una sola vez (o reutiliza la caché si no ha
+    cambiado) y después aplica el reparto de cada tabla, que no se guarda en caché.
+    """
+    print(f"\n📂 Procesando archivo: {os.path.basename(path)}")
+    df_limpio = cached_parse(path, base.leer_y_limpiar, f"{PARSE_VERSION}-{file_fingerprint(path)}")
+    resultado = repartir(df_limpio)
+    base.chequear_equilibrio(resultado[base.TABLA_DESTINO])
+    return resultado
+
+
+def cargar_archivo(path, resultado, diff=False, politica="omitir", paralelo=1):
+    """
+    Escribe las dos tablas a la vez, cada una con su conexión y su política de carga,
+    y mueve el archivo a procesados solo si ambas cargas terminan bien.
+    """
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="carga") as pool:
+        futuros = {
+            base.TABLA_DESTINO: pool.submit(
+                base.subir_comisiones, resultado[base.TABLA_DESTINO], base.TABLA_DESTINO,
+                batch_size=2000, diff=diff),
+            historial.TABLA_DESTINO: pool.submit(
+                historial.subir_comisiones_historico, resultado[historial.TABLA_DESTINO],
+                historial.TABLA_DESTINO, batch_size=1000, politica=politica, paralelo=paralelo),
+        }
+        errores = {}
+        for tabla, futuro in futuros.items():
+            try:
+                futuro.result()
+            except Exception as e:
+                print(f"❌ Error cargando {tabla} desde {os.path.basename(path)}: {e}")
+                errores[tabla] = e
+
+    if errores:
+        raise RuntimeError(f"Carga incompleta de {os.path.basename(path)} en: {', '.join(errores)}")
+
+    procesados_path = os.path.join(FOLDER_PATH, "procesados")
+    os.makedirs(procesados_path, exist_ok=True)
+    archivo_destino = os.path.join(procesados_path, os.path.basename(path))
+    if os.path.exists(archivo_destino):
+        os.remove(archivo_destino)
+    os.rename(path, archivo_destino)
+    print(f"📁 Archivo movido a: {archivo_destino}")
+
+
+def main(pipeline=False, workers=1, diff=False, politica="omitir", paralelo=1):
+    if not FOLDER_PATH:
+        print("❌ La variable de entorno PROCESO_BASE_FOLDER no está definida.")
+        return
+
+    files = base.get_files_from_folder(FOLDER_PATH)
+    if not files:
+        print("📭 No se encontraron archivos para procesar.")
+        return
+
+    def cargar(path, resultado):
+        cargar_archivo(path, resultado, diff=diff, politica=politica, paralelo=paralelo)
+
+    if pipeline:
+        # 🔀 El archivo N+1 se transforma mientras se suben las dos tablas del N
+        run_pipeline(files, preparar_archivo, cargar, workers=workers)
+    else:
+        for path, resultado, error in iter_parsed(files, preparar_archivo, workers=workers):
+            if error is not None:
+                print(f"❌ Error leyendo {os.path.basename(path)}: {error}")
+                continue
+            cargar(path, resultado)
+
+
+if __name__ == "__main__":
+    pipeline, workers = pipeline_args(sys.argv[1:])
+    paralelo = 1
+    if "--paralelo" in sys.argv:
+        idx = sys.argv.index("--paralelo")
+        valor = sys.argv[idx + 1] if idx + 1 < len(sys.argv) else ""
+        paralelo = int(valor) if valor.isdigit() else max(1, DB_POOL_SIZE - 2)
+    main(pipeline=pipeline, workers=workers, diff="--diff" in sys.argv, paralelo=paralelo,
+         politica="reemplazar" if "--reemplazar" in sys.argv else "omitir")
@@ -1,24 +1,42 @@
 import os
+import sys
 import pandas as pd
 from dotenv import load_dotenv
 import pyodbc
-from services.db_connector import get_connection
-import uuid
-import time
+from services.db_connector import session
+from services.bulk_writer import bulk_insert, create_temp_copy
+from services.pipeline import run_pipeline, iter_parsed, pipeline_args
+from services.xlsx_reader import is_xlsx, read_xlsx
+from services.parse_cache import cached_parse
+from services.comisiones import desdoblar_comisiones, fix_comisiones
+from services.row_ids import file_fingerprint, row_guids
+from services.reconcile import LoadStats, reconcile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
+from config import DB_POOL_SIZE
 
 # Cargar .env
 load_dotenv()
-FOLDER_PATH = os.getenv("PROCESO_BASE_FOLDER").strip('"')
+FOLDER_PATH = (os.getenv("PROCESO_BASE_FOLDER") or "").strip('"')
 
 # Extensiones válidas
 VALID_EXTENSIONS = (".xlsx", ".xls", ".csv")
 
+# Versión de la cadena de transformación: cambiarla invalida la caché de lecturas
+PARSE_VERSION = "datos_normalizados_historial-4"
+
+TABLA_DESTINO = "Datos_Normalizados_historial"
+
+# Columnas de Datos_Normalizados_historial en el orden de inserción
+COLUMNAS_DESTINO = [
+    'FECHA_ALTA', 'SAP', 'IND_PRIMERA_UTIL_INTERNA', 'FTCI', 'NUM_OPERACIONES',
+    'IMPORTE_NUMERICO', 'VENDEDOR', 'IMPORTE', 'FUENTE', 'indice', 'numPersonal', 'guid'
+]
+
 pd.set_option("display.width", None)
 pd.set_option("display.max_columns", None)
 
-def generar_guid():
-    return uuid.uuid4().hex[:12]
-
 def get_files_from_folder(folder_path):
     return sorted([
         os.path.join(folder_path, f)
@@ -28,10 +46,12 @@ def get_files_from_folder(folder_path):
 
 def read_file_as_text(path):
     ext = os.path.splitext(path)[1].lower()
-    if ext in [".xlsx", ".xls"]:
+    if is_xlsx(path):
+        return read_xlsx(path, as_str=True)
+    elif ext == ".xls":
         return pd.read_excel(path, dtype=str)
     elif ext == ".csv":
-        return pd.read_csv(path, dtype=str, sep=';', encoding='utf-8', engine='python')
+        return pd.read_csv(path, dtype=str, sep=';', encoding='utf-8', engine='c')
     else:
         raise ValueError(f"Extensión de archivo no soportada: {ext}")
 
@@ -50,139 +70,200 @@ def fix_importe(df):
     df['IMPORTE'] = pd.to_numeric(df['IMPORTE'], errors='coerce').fillna(0).round(2)
     return df
 
-def fix_comisiones(df):
-    df['IMPORTE'] = pd.to_numeric(df['IMPORTE'], errors='coerce').fillna(0).round(2)
-    df['com_COD_VEND'] = (df['IMPORTE'] * 0.20).round(2) #### Cambio a 0.40 pendiente de aprobar
-    df['com_VEND_FIRMA'] = (df['IMPORTE'] - df['com_COD_VEND']).round(2)
-    return df
+# Qué hacer con un mes que ya está cargado: saltarlo o borrarlo y volver a cargarlo
+POLITICAS_MES = ("omitir", "reemplazar")
 
-def desdoblar_comisiones(df):
-    df['IMPORTE_NUMERICO'] = df['IMPORTE']
-    
-    # COD_VEND
-    cod_rows = df.copy()
-    cod_rows['FUENTE'] = 'COD_VEND'
-    cod_rows['IMPORTE'] = cod_rows['com_COD_VEND']
-    cod_rows['VENDEDOR'] = cod_rows['COD_VEND']
-    cod_rows['guid'] = df['guid']
-    
-    # VEND_FIRMA
-    firma_rows = df.copy()
-    firma_rows['FUENTE'] = 'VEND_FIRMA'
-    firma_rows['IMPORTE'] = firma_rows['com_VEND_FIRMA']
-    firma_rows['VENDEDOR'] = firma_rows['VEND_FIRMA']
-    firma_rows['guid'] = df['guid']
-
-    df_final = pd.concat([cod_rows, firma_rows], ignore_index=True)
-    df_final['numPersonal'] = df_final['VENDEDOR']
-    df_final['indice'] = df_final['SAP'] + df_final['VENDEDOR']
-    df_final = df_final.drop(columns=[
-        'COD_VEND', 'VEND_FIRMA', 'com_COD_VEND', 'com_VEND_FIRMA', 'KPI', 'AÑO', 'MES','NOMBRE'
-    ], errors='ignore')
-    df_final = df_final.sort_values(by=['guid', 'FUENTE']).reset_index(drop=True)
-    return df_final
-
-def subir_comisiones_historico(df, tabla_destino, batch_size=500):
-    if df.empty:
-        print("ℹ️ El DataFrame está vacío, no hay nada que subir.")
-        return
+INDICE_FECHA = "IX_historial_fecha_alta"
 
-    conn = get_connection()
-    cursor = conn.cursor()
 
-    df['FECHA_ALTA'] = pd.to_datetime(df['FECHA_ALTA'], errors='coerce')
-    
-    primera_fecha_valida = df['FECHA_ALTA'].dropna().iloc[0]
-    mes_a_cargar = primera_fecha_valida.month
-    año_a_cargar = primera_fecha_valida.year
+def rango_mes(año, mes):
+    """[inicio, fin) del mes, para filtrar FECHA_ALTA con un rango sargable (usa el índice)."""
+    inicio = date(año, mes, 1)
+    fin = date(año + 1, 1, 1) if mes == 12 else date(año, mes + 1, 1)
+    return inicio, fin
 
-    print(f"🗓️  Verificando si los datos para {mes_a_cargar}/{año_a_cargar} ya existen en la tabla '{tabla_destino}'...")
 
-    cursor.execute(f"""
-        SELECT TOP 1 1 
-        FROM {tabla_destino} 
-        WHERE YEAR(FECHA_ALTA) = ? AND MONTH(FECHA_ALTA) = ?
-    """, año_a_cargar, mes_a_cargar)
-
-    if cursor.fetchone():
-        print(f"⚠️  Los datos para el mes {mes_a_cargar}/{año_a_cargar} ya existen. No se subirán de nuevo.")
+def asegurar_indice_fecha(tabla_destino):
+    """Crea (si no existe) el índice sobre FECHA_ALTA que usan las comprobaciones por mes."""
+    with session() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = ? AND object_id = OBJECT_ID(?))
+                CREATE INDEX {INDICE_FECHA} ON {tabla_destino} (FECHA_ALTA)
+        """, (INDICE_FECHA, tabla_destino))
+        conn.commit()
         cursor.close()
-        conn.close()
-        return
 
-    print(f"✅ El mes {mes_a_cargar}/{año_a_cargar} no existe. Procediendo a la carga en '{tabla_destino}'...")
-    
+
+def cargar_mes(df_mes, tabla_destino, año, mes, politica="omitir", batch_size=500):
+    """
+    Carga (o reemplaza) una partición mensual en su propia conexión. Devuelve las filas insertadas.
+
+    El mes se sube primero a una tabla temporal; después, en una sola transacción, se borra
+    el mes anterior (si se reemplaza) y se copia desde la temporal. Si la carga falla a
+    mitad, la tabla conserva el mes tal como estaba.
+
+    La temporal es privada de la sesión, así que la subida no se frena con ThroughputController:
+    la tabla compartida solo recibe el INSERT ... SELECT del mes completo, en una transacción
+    (a cambio de ser atómico, el mes entero bloquea la tabla mientras dura la copia).
+    """
+    inicio, fin = rango_mes(año, mes)
+    with session() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT TOP 1 1
+            FROM {tabla_destino}
+            WHERE FECHA_ALTA >= ? AND FECHA_ALTA < ?
+        """, (inicio, fin))
+        existe = cursor.fetchone() is not None
+
+        if existe and politica == "omitir":
+            print(f"⚠️  Los datos para el mes {mes}/{año} ya existen. No se subirán de nuevo.")
+            cursor.close()
+            return 0
+
+        print(f"🚀 Subiendo {len(df_mes)} registros del mes {mes}/{año} a '{tabla_destino}'...")
+        stats = LoadStats(amount_column='IMPORTE')
+        staging = create_temp_copy(cursor, conn, "historial_mes", tabla_destino, COLUMNAS_DESTINO)
+        bulk_insert(staging, COLUMNAS_DESTINO, df_mes, conn=conn, batch_size=batch_size,
+                    row_fallback=True, stats=stats)
+
+        cols = ", ".join(COLUMNAS_DESTINO)
+        try:
+            if existe:
+                print(f"🔁 Reemplazando el mes {mes}/{año} en '{tabla_destino}'...")
+                cursor.execute(f"DELETE FROM {tabla_destino} WHERE FECHA_ALTA >= ? AND FECHA_ALTA < ?", (inicio, fin))
+            cursor.execute(f"INSERT INTO {tabla_destino} ({cols}) SELECT {cols} FROM {staging}")
+            insertados = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+            conn.commit()
+            cursor.close()
+
+        # El mes estaba vacío (o se acaba de reemplazar): el agregado del rango son justo las filas de esta carga
+        reconcile(conn, tabla_destino, stats, where="FECHA_ALTA >= ? AND FECHA_ALTA < ?",
+                  params=(inicio, fin), scope=f"{año}-{mes:02d}")
+    descartados = len(df_mes) - insertados
+    print(f"✅ Subida finalizada para {mes}/{año}. Se insertaron {insertados} registros en '{tabla_destino}'"
+          + (f" ({descartados} filas con error descartadas)." if descartados else "."))
+    return insertados
+
+
+def subir_comisiones_historico(df, tabla_destino, batch_size=500, politica="omitir", paralelo=1):
+    """
+    Reparte el archivo por mes de FECHA_ALTA y carga cada mes de forma independiente
+    (saltándolo o reemplazándolo si ya existe, según `politica`). Con paralelo > 1 los
+    meses se cargan a la vez, cada uno con su conexión del pool.
+    """
+    if df.empty:
+        print("ℹ️ El DataFrame está vacío, no hay nada que subir.")
+        return {}
+    if politica not in POLITICAS_MES:
+        raise ValueError(f"Política desconocida: {politica} (válidas: {POLITICAS_MES})")
+
+    df['FECHA_ALTA'] = pd.to_datetime(df['FECHA_ALTA'], errors='coerce')
+    sin_fecha = df['FECHA_ALTA'].isna()
+    if sin_fecha.any():
+        print(f"⚠️  {int(sin_fecha.sum())} registros sin FECHA_ALTA válida no se pueden asignar a un mes y no se suben.")
+        df = df[~sin_fecha].copy()
+
     for col in ['SAP', 'VENDEDOR', 'indice', 'numPersonal', 'FTCI', 'guid']:
         df[col] = df[col].fillna('').astype(str).str.strip()
-    
+
     for col in ['IND_PRIMERA_UTIL_INTERNA', 'NUM_OPERACIONES']:
         df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-    
+
     for col in ['IMPORTE_NUMERICO', 'IMPORTE']:
         df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).round(2)
-    
+
+    periodos = df['FECHA_ALTA'].dt.to_period('M')
     df['FECHA_ALTA'] = df['FECHA_ALTA'].dt.date
+    meses = [(p.year, p.month, grupo) for p, grupo in df.groupby(periodos, sort=True)]
 
-    count_local = len(df)
+    print(f"🗓️  {len(df)} registros en {len(meses)} meses para '{tabla_destino}' (política: {politica}).")
+    asegurar_indice_fecha(tabla_destino)
+
+    cargar = partial(cargar_mes, tabla_destino=tabla_destino, politica=politica, batch_size=batch_size)
+    resultados = {}
+    if paralelo > 1 and len(meses) > 1:
+        with ThreadPoolExecutor(max_workers=paralelo) as pool:
+            futuros = {(año, mes): pool.submit(cargar, grupo, año=año, mes=mes) for año, mes, grupo in meses}
+            for clave, futuro in futuros.items():
+                resultados[clave] = futuro.result()
+    else:
+        for año, mes, grupo in meses:
+            resultados[(año, mes)] = cargar(grupo, año=año, mes=mes)
+
+    cargados = sum(1 for n in resultados.values() if n)
+    print(f"\n📊 {cargados} de {len(meses)} meses cargados, {sum(resultados.values())} registros insertados.")
+    return resultados
+
+
+def leer_y_limpiar(path):
+    """Lectura y limpieza previas al reparto (lo que se guarda en la caché de lecturas)."""
+    df_original = read_file_as_text(path)
     
-    # ## CAMBIO AÑADIDO ##
-    print(f"\n🚀 Se subirán un total de {count_local} registros a la tabla '{tabla_destino}'.")
-
-    for i in range(0, count_local, batch_size):
-        batch = df.iloc[i:i+batch_size]
-        print(f"📦 Insertando registros {i+1} a {i+len(batch)}...")
-        for idx, row in batch.iterrows():
-            try:
-                cursor.execute(f"""
-                    INSERT INTO {tabla_destino} (
-                        FECHA_ALTA, SAP, IND_PRIMERA_UTIL_INTERNA, FTCI, NUM_OPERACIONES,
-                        IMPORTE_NUMERICO, VENDEDOR, IMPORTE, FUENTE, indice, numPersonal, guid
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, row['FECHA_ALTA'], row['SAP'], row['IND_PRIMERA_UTIL_INTERNA'], row['FTCI'],
-                    row['NUM_OPERACIONES'], row['IMPORTE_NUMERICO'], row['VENDEDOR'],
-                    row['IMPORTE'], row['FUENTE'], row['indice'], row['numPersonal'], row['guid'])
-            except Exception as e:
-                print(f"❌ Error en fila {idx}: {e}")
-                print(row.to_dict())
-        conn.commit()
+    df_original["guid"] = row_guids(df_original, path)
+    df_original = fix_vend_firma(df_original)
+    df_original = fix_codigos_vacios(df_original)
+    return fix_importe(df_original)
 
-        if i + batch_size < count_local:
-            print(f"☕ Lote confirmado. Pausando 5 segundos...")
-            time.sleep(5)
+def transformar_archivo(path):
+    """Lee el archivo y aplica toda la cadena de transformaciones."""
+    return desdoblar_comisiones(fix_comisiones(leer_y_limpiar(path), TABLA_DESTINO))
 
-    print(f"✅ Subida finalizada para {mes_a_cargar}/{año_a_cargar}. Se insertaron {count_local} registros en '{tabla_destino}'.")
-    cursor.close()
-    conn.close()
+def preparar_archivo(path):
+    """Etapa de lectura: reutiliza la limpieza en caché y aplica la regla de reparto vigente."""
+    print(f"\n📂 Procesando archivo: {os.path.basename(path)}")
+    df_limpio = cached_parse(path, leer_y_limpiar, f"{PARSE_VERSION}-{file_fingerprint(path)}")
+    return desdoblar_comisiones(fix_comisiones(df_limpio, TABLA_DESTINO))
 
+def cargar_archivo(path, df_final, politica="omitir", paralelo=1):
+    """Sube el archivo ya transformado y lo mueve a procesados (etapa de escritura)."""
+    subir_comisiones_historico(df_final, TABLA_DESTINO, batch_size=1000,
+                               politica=politica, paralelo=paralelo)
+    
+    procesados_path = os.path.join(FOLDER_PATH, "procesados")
+    os.makedirs(procesados_path, exist_ok=True)
+    archivo_destino = os.path.join(procesados_path, os.path.basename(path))
+    
+    if os.path.exists(archivo_destino):
+        os.remove(archivo_destino)
+
+    os.rename(path, archivo_destino)
+    print(f"📁 Archivo movido a: {archivo_destino}")
+
+def main(pipeline=False, workers=1, politica="omitir", paralelo=1):
+    if not FOLDER_PATH:
+        print("❌ La variable de entorno PROCESO_BASE_FOLDER no está definida.")
+        return
 
-def main():
     files = get_files_from_folder(FOLDER_PATH)
     if not files:
         print("📭 No se encontraron archivos para procesar.")
         return
 
-    for path in files:
-        print(f"\n📂 Procesando archivo: {os.path.basename(path)}")
-        df_original = read_file_as_text(path)
-        
-        df_original["guid"] = [generar_guid() for _ in range(len(df_original))]
-        df_original = fix_vend_firma(df_original)
-        df_original = fix_codigos_vacios(df_original)
-        df_original = fix_importe(df_original)
-        df_original = fix_comisiones(df_original)
-        df_final = desdoblar_comisiones(df_original)
-
-        subir_comisiones_historico(df_final, "Datos_Normalizados_historial", batch_size=1000)
-        
-        procesados_path = os.path.join(FOLDER_PATH, "procesados")
-        os.makedirs(procesados_path, exist_ok=True)
-        archivo_destino = os.path.join(procesados_path, os.path.basename(path))
-        
-        if os.path.exists(archivo_destino):
-            os.remove(archivo_destino)
-
-        os.rename(path, archivo_destino)
-        print(f"📁 Archivo movido a: {archivo_destino}")
+    cargar = partial(cargar_archivo, politica=politica, paralelo=paralelo)
+    if pipeline:
+        # 🔀 El archivo N+1 se transforma mientras se sube el N
+        run_pipeline(files, preparar_archivo, cargar, workers=workers)
+    else:
+        for path, resultado, error in iter_parsed(files, preparar_archivo, workers=workers):
+            if error is not None:
+                print(f"❌ Error leyendo {os.path.basename(path)}: {error}")
+                continue
+            cargar(path, resultado)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    pipeline, workers = pipeline_args(sys.argv[1:])
+    paralelo = 1
+    if "--paralelo" in sys.argv:
+        idx = sys.argv.index("--paralelo")
+        valor = sys.argv[idx + 1] if idx + 1 < len(sys.argv) else ""
+        paralelo = int(valor) if valor.isdigit() else DB_POOL_SIZE
+    main(pipeline=pipeline, workers=workers, paralelo=paralelo,
+         politica="reemplazar" if "--reemplazar" in sys.argv else "omitir")
@@ -5,88 +5,54 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
 
-import pandas as pd
 from dotenv import load_dotenv
-from services.db_connector import get_connection
+from services.db_connector import session, print_pool_stats
+from services.bulk_writer import bulk_insert
+from services.sql_reader import fetch_set
+from services.xlsx_reader import read_xlsx
+from services.schemas import PRODUCCION, source_columns, parse_frame, print_report
 
 # Cargar .env
 load_dotenv()
-EXCEL_PATH = os.getenv("PRODUCCION_EXCEL_PATH").strip('"')
+EXCEL_PATH = (os.getenv("PRODUCCION_EXCEL_PATH") or "").strip('"')
 
 TABLAS = {
     "mes en curso": "produccion",
     "acumulado": "produccion_historial"
 }
 
-COLUMNAS_MAP = {
-    "fecha": "fecha",
-    "Codigo Tienda": "Codigo_Tienda",
-    "Producción Rentable": "produccion_rentable",
-    "Ventas_Venta_gross": "Ventas_Venta_Gross"
-}
+# Columnas de la pestaña y su tipo: ver services/schemas.PRODUCCION
 
 def leer_existentes(tabla):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT fecha FROM {tabla}")
-    fechas = set(row[0] for row in cursor.fetchall())
-    cursor.close()
-    conn.close()
+    with session() as conn:
+        cursor = conn.cursor()
+        fechas = fetch_set(cursor, f"SELECT fecha FROM {tabla}", nombre=f"Fechas de {tabla}")
+        cursor.close()
     return fechas
 
 def insertar_nuevos(tabla, df, batch_size=500):
     if df.empty:
         return 0
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    total = len(df)
-
-    for i in range(0, total, batch_size):
-        batch = df.iloc[i:i + batch_size]
-        print(f"📦 Insertando registros {i + 1} a {i + len(batch)} de {total}...")
-        for _, row in batch.iterrows():
-            cursor.execute(f"""
-                INSERT INTO {tabla} (fecha, Codigo_Tienda, Produccion_Rentable, Ventas_Venta_Gross)
-                VALUES (?, ?, ?, ?)
-            """, row["fecha"], row["Codigo_Tienda"], row["produccion_rentable"], row["Ventas_Venta_Gross"])
-        conn.commit()
-
-    cursor.close()
-    conn.close()
-    return total
+    columnas = {
+        "fecha": "fecha",
+        "Codigo_Tienda": "Codigo_Tienda",
+        "produccion_rentable": "Produccion_Rentable",
+        "Ventas_Venta_Gross": "Ventas_Venta_Gross"
+    }
+    datos = {destino: df[origen] for origen, destino in columnas.items()}
+    return bulk_insert(tabla, list(columnas.values()), datos, batch_size=batch_size)
 
 
 def procesar_pestana(pestana, tabla_destino):
     print(f"\n📄 Procesando pestaña: {pestana} → tabla: {tabla_destino}")
-    df = pd.read_excel(EXCEL_PATH, sheet_name=pestana, engine='openpyxl', converters={col: str for col in COLUMNAS_MAP.keys()})
-
-    df = df.astype(str)
-
-    #print(df.dtypes)
-
-    #print("📋 Columnas leídas:", df.columns.tolist())
-    #print(df)
-
-    df = df[list(COLUMNAS_MAP.keys())]
-    df = df.rename(columns=COLUMNAS_MAP)
-    df = df.fillna("")
-
-    # Fecha
-    df['fecha'] = pd.to_datetime(df['fecha'], errors='coerce').dt.date
-
-    # Conversión segura de campos numéricos
-    for col in ['produccion_rentable', 'Ventas_Venta_Gross']:
-        df[col] = (
-            df[col]
-            .astype(str)
-            .str.strip()
-            .replace('', '0')      # coma decimal a punto
-        )
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).round(2)
-        #print(df)
+    # Lectura en streaming (openpyxl read-only) de las columnas necesarias
+    df = read_xlsx(EXCEL_PATH, sheet_name=pestana, columns=source_columns(PRODUCCION))
 
-    df = df.dropna(subset=['fecha'])
+    # Fecha e importes convertidos en una sola pasada; sin fecha válida la fila se descarta
+    df, informe = parse_frame(df, PRODUCCION, nombre=pestana)
+    print_report(informe)
+    df['fecha'] = df['fecha'].dt.date
 
     # Comparar fechas
     fechas_existentes = leer_existentes(tabla_destino)
@@ -106,6 +72,7 @@ def main():
 
     print("\n📊 Resumen total:")
     print(f"✔️ Registros insertados: {total_insertados}")
+    print_pool_stats()
 
 if __name__ == "__main__":
     main()
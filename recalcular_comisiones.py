@@ -0,0 +1,85 @@
+import sys
+from datetime import date, datetime, timedelta
+
+from services.db_connector import session
+from services.comisiones import REGLAS_REPARTO, tramos
+
+# Alias de línea de comandos → tabla destino
+TABLAS = {
+    "base": "Datos_Normalizados",
+    "historial": "Datos_Normalizados_historial",
+}
+
+
+def meses(inicio, fin):
+    """Trocea [inicio, fin) por meses naturales: cada UPDATE (y su log de transacción) queda acotado."""
+    actual = inicio
+    while actual < fin:
+        siguiente = date(actual.year + 1, 1, 1) if actual.month == 12 else date(actual.year, actual.month + 1, 1)
+        yield actual, min(siguiente, fin)
+        actual = siguiente
+
+
+def rango_tabla(cursor, tabla):
+    """[primer día del mes de la FECHA_ALTA mínima, día siguiente a la máxima) de la tabla."""
+    cursor.execute(f"SELECT MIN(FECHA_ALTA), MAX(FECHA_ALTA) FROM {tabla}")
+    minima, maxima = cursor.fetchone()
+    if minima is None:
+        return None, None
+    minima = minima.date() if isinstance(minima, datetime) else minima
+    maxima = maxima.date() if isinstance(maxima, datetime) else maxima
+    return minima.replace(day=1), maxima + timedelta(days=1)
+
+
+def recalcular(tabla, desde=None, hasta=None):
+    """
+    Vuelve a derivar IMPORTE de las filas COD_VEND/VEND_FIRMA de `tabla` con FECHA_ALTA en
+    [desde, hasta) a partir del IMPORTE_NUMERICO guardado, aplicando la regla de reparto
+    vigente en cada tramo (services/comisiones.REGLAS_REPARTO). Un UPDATE por mes y regla.
+    Sin fechas se recalcula todo el rango de FECHA_ALTA de la tabla.
+    """
+    total = 0
+    with session() as conn:
+        cursor = conn.cursor()
+        if desde is None or hasta is None:
+            minima, maxima = rango_tabla(cursor, tabla)
+            if minima is None:
+                print(f"📭 La tabla {tabla} está vacía.")
+                cursor.close()
+                return 0
+            desde, hasta = desde or minima, hasta or maxima
+        for inicio_tramo, fin_tramo, tasa in tramos(tabla, desde, hasta):
+            print(f"📐 {inicio_tramo} → {fin_tramo}: COD_VEND {tasa:.0%} / VEND_FIRMA {1 - tasa:.0%}")
+            for inicio, fin in meses(inicio_tramo, fin_tramo):
+                cursor.execute(f"""
+                    UPDATE {tabla}
+                    SET IMPORTE = CASE FUENTE
+                        WHEN 'COD_VEND' THEN ROUND(IMPORTE_NUMERICO * ?, 2)
+                        ELSE IMPORTE_NUMERICO - ROUND(IMPORTE_NUMERICO * ?, 2)
+                    END
+                    WHERE FECHA_ALTA >= ? AND FECHA_ALTA < ?
+                      AND FUENTE IN ('COD_VEND', 'VEND_FIRMA')
+                """, (tasa, tasa, inicio, fin))
+                filas = cursor.rowcount
+                conn.commit()
+                total += filas
+                print(f"   🔁 {inicio:%Y-%m}: {filas} filas recalculadas")
+        cursor.close()
+    print(f"✅ {total} filas recalculadas en {tabla}.")
+    return total
+
+
+def main(tabla="historial", desde=None, hasta=None):
+    tabla = TABLAS.get(tabla, tabla)
+    if tabla not in REGLAS_REPARTO:
+        print(f"❌ No hay reglas de reparto para la tabla {tabla}.")
+        return
+    recalcular(tabla, desde, hasta)
+
+
+if __name__ == "__main__":
+    # Misma línea de comandos que `finance.py recalcular`: <base|historial> [--desde AAAA-MM-DD] [--hasta AAAA-MM-DD]
+    from finance import build_parser
+
+    args = build_parser().parse_args(["recalcular"] + sys.argv[1:])
+    main(tabla=args.tabla, desde=args.desde, hasta=args.hasta)
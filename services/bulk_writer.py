@@ -0,0 +1,169 @@
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+from services import db_connector
+
+# SQL Server admite como máximo 2100 parámetros por sentencia y 1000 filas por VALUES
+MAX_PARAMS = 2100
+MAX_VALUES_ROWS = 1000
+
+
+def _column_values(values):
+    """Convierte una columna (Series, array o lista) en lista de valores Python con None en lugar de NaN/NaT."""
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values)
+    values = values.astype(object)
+    return values.where(values.notna(), None).tolist()
+
+
+def to_columns(data, columns):
+    """
+    Normaliza la entrada del escritor a una lista de columnas (listas Python) en el orden de `columns`.
+    Acepta un DataFrame, un dict de columnas (listas/arrays/Series) o una lista de dicts.
+    """
+    if isinstance(data, pd.DataFrame):
+        return [_column_values(data[col]) for col in columns]
+    if isinstance(data, dict):
+        return [_column_values(data[col]) for col in columns]
+    # Lista de registros (dicts)
+    return [_column_values([rec[col] for rec in data]) for col in columns]
+
+
+def _sqlite_values(values):
+    """sqlite3 no sabe enlazar pd.Timestamp (y avisa con datetime/date): se envían como texto ISO."""
+    return [
+        v.isoformat(sep=" ") if isinstance(v, datetime) else v.isoformat() if isinstance(v, date) else v
+        for v in values
+    ]
+
+
+def is_sqlite(conn):
+    """Permite usar una BBDD SQLite local como sustituto del SQL Server en pruebas."""
+    return type(conn).__module__.startswith("sqlite3")
+
+
+def create_temp_copy(cursor, conn, name, table, columns, row_id=False):
+    """
+    Crea una tabla temporal vacía con las columnas (y tipos) de `table`. Devuelve su nombre.
+    Con row_id=True añade una columna entera `fila` para identificar cada candidato.
+    """
+    cols = ", ".join((["CAST(0 AS INT) AS fila"] if row_id else []) + list(columns))
+    if is_sqlite(conn):
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{name}")
+        cursor.execute(f"CREATE TEMP TABLE {name} AS SELECT {cols} FROM {table} WHERE 0 = 1")
+        return f"temp.{name}"
+    cursor.execute(f"DROP TABLE IF EXISTS #{name}")
+    cursor.execute(f"SELECT TOP 0 {cols} INTO #{name} FROM {table}")
+    return f"#{name}"
+
+
+def _rows_per_statement(n_columns, batch_size):
+    """Filas por sentencia multi-VALUES respetando el límite de parámetros del servidor."""
+    return max(1, min(batch_size, MAX_VALUES_ROWS, (MAX_PARAMS - 1) // n_columns))
+
+
+def _insert_batch(cursor, sql, rows, method, n_columns, batch_size):
+    if method == "fast_executemany":
+        cursor.executemany(sql, rows)
+        return
+    # multi-row VALUES: troceado según el límite de parámetros
+    step = _rows_per_statement(n_columns, batch_size)
+    placeholders = "(" + ", ".join("?" * n_columns) + ")"
+    head = sql.split(" VALUES ")[0]
+    for j in range(0, len(rows), step):
+        chunk = rows[j:j + step]
+        params = [value for row in chunk for value in row]
+        cursor.execute(f"{head} VALUES " + ", ".join([placeholders] * len(chunk)), params)
+
+
+def _insert_row_by_row(cursor, sql, rows, offset):
+    """Reintenta un lote fila a fila para localizar y saltar las filas con error. Devuelve las insertadas."""
+    inserted = []
+    for k, row in enumerate(rows):
+        try:
+            cursor.execute(sql, row)
+            inserted.append(row)
+        except Exception as e:
+            print(f"❌ Error en fila {offset + k}: {e}")
+            print(row)
+    return inserted
+
+
+def bulk_insert(table, columns, data, conn=None, batch_size=1000, method="fast_executemany",
+                row_fallback=False, controller=None, stats=None):
+    """
+    Inserta en bloque `data` en `table` enviando lotes con parámetros enlazados por array.
+
+    - method="fast_executemany": executemany con cursor.fast_executemany (pyodbc).
+    - method="values": INSERT multi-fila (VALUES (...), (...)) troceado por el límite de parámetros.
+    - row_fallback=True: si un lote falla, se reintenta fila a fila informando de las filas erróneas.
+    - controller: ThroughputController (services/throttle) que adapta el tamaño de lote
+      y las pausas a la latencia medida de cada commit.
+    - stats: LoadStats (services/reconcile) que acumula filas, importe y hash de cada lote confirmado.
+
+    Confirma (commit) tras cada lote y devuelve el número de filas insertadas.
+    """
+    if conn is None:
+        with db_connector.session() as conn:
+            return bulk_insert(table, columns, data, conn=conn, batch_size=batch_size,
+                               method=method, row_fallback=row_fallback, controller=controller,
+                               stats=stats)
+
+    columns = list(columns)
+    col_values = to_columns(data, columns)
+    total = len(col_values[0]) if col_values else 0
+    if total == 0:
+        return 0
+    if is_sqlite(conn):
+        col_values = [_sqlite_values(col) for col in col_values]
+
+    if stats is not None:
+        stats.bind(columns)
+
+    cursor = conn.cursor()
+    if method == "fast_executemany" and hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))})"
+    )
+
+    inserted = 0
+    start = time.perf_counter()
+    try:
+        i = 0
+        while i < total:
+            size = controller.batch_size if controller else batch_size
+            rows = list(zip(*(col[i:i + size] for col in col_values)))
+            print(f"📦 Insertando registros {i + 1} a {i + len(rows)} de {total}...")
+            batch_start = time.perf_counter()
+            try:
+                _insert_batch(cursor, sql, rows, method, len(columns), size)
+                ok_rows = rows
+            except Exception:
+                if not row_fallback:
+                    raise
+                conn.rollback()
+                ok_rows = _insert_row_by_row(cursor, sql, rows, i)
+            conn.commit()
+            inserted += len(ok_rows)
+            if stats is not None:
+                stats.add_batch(ok_rows)
+            i += len(rows)
+            if controller:
+                pause = controller.record(len(rows), time.perf_counter() - batch_start)
+                if i < total:
+                    controller.wait(pause)
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - start
+    rate = inserted / elapsed if elapsed > 0 else float("inf")
+    print(f"⚡ {inserted} registros insertados en {table} en {elapsed:.2f}s ({rate:,.0f} filas/s)")
+    if controller:
+        print(f"🎚️ Ritmo efectivo con pausas: {controller.rows_per_second():,.0f} filas/s"
+              f" ({controller.paused_seconds:.1f}s en pausa)")
+    return inserted
@@ -0,0 +1,124 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Reglas de reparto versionadas por tabla destino: parte de la comisión para COD_VEND
+# (VEND_FIRMA se lleva el resto) vigente desde `desde` (incluido) hasta `hasta` (excluido,
+# None = sin fin). Un cambio de tasa se registra cerrando la regla vigente y añadiendo otra.
+REGLAS_REPARTO = {
+    "Datos_Normalizados": [
+        {"desde": date(1900, 1, 1), "hasta": None, "cod_vend": 0.40},
+    ],
+    "Datos_Normalizados_historial": [
+        {"desde": date(1900, 1, 1), "hasta": None, "cod_vend": 0.20},  # cambio a 0.40 pendiente de aprobar
+    ],
+}
+
+# Columnas intermedias que no pasan a Datos_Normalizados
+COLUMNAS_INTERMEDIAS = ['COD_VEND', 'VEND_FIRMA', 'com_COD_VEND', 'com_VEND_FIRMA', 'KPI', 'AÑO', 'MES', 'NOMBRE']
+
+# Mitades de cada operación, en el orden en que se emiten: (FUENTE, vendedor, comisión)
+MITADES = [
+    ('COD_VEND', 'COD_VEND', 'com_COD_VEND'),
+    ('VEND_FIRMA', 'VEND_FIRMA', 'com_VEND_FIRMA'),
+]
+
+
+def reglas(tabla):
+    """Reglas de `tabla` ordenadas por fecha de inicio."""
+    if tabla not in REGLAS_REPARTO:
+        raise ValueError(f"No hay reglas de reparto para la tabla {tabla}")
+    return sorted(REGLAS_REPARTO[tabla], key=lambda r: r["desde"])
+
+
+def tasa_cod_vend(tabla, fechas):
+    """
+    Tasa de COD_VEND para cada fecha: la regla cuyo [desde, hasta) la contiene (searchsorted
+    sobre los inicios de vigencia y comprobación del fin), igual que los tramos de tramos().
+    Una fecha nula, no convertible o sin regla vigente detiene la carga con ValueError.
+    """
+    lista = reglas(tabla)
+    inicios = pd.to_datetime([r["desde"] for r in lista]).to_numpy()
+    fines = pd.to_datetime([r["hasta"] for r in lista]).to_numpy()  # NaT = sin fin
+    tasas = np.array([r["cod_vend"] for r in lista])
+
+    originales = pd.Series(fechas).reset_index(drop=True)
+    fechas = pd.to_datetime(originales, errors='coerce')
+    valores = fechas.to_numpy()
+    pos = np.searchsorted(inicios, valores, side='right') - 1
+    fin = fines[np.clip(pos, 0, None)]
+    vigente = fechas.notna().to_numpy() & (pos >= 0) & (np.isnat(fin) | (valores < fin))
+    if not vigente.all():
+        malas = originales[~vigente]
+        raise ValueError(
+            f"{len(malas)} filas sin regla de reparto vigente para {tabla} "
+            f"(fecha nula, no válida o fuera de toda regla), p. ej.: {malas.head(5).tolist()}"
+        )
+    return tasas[pos]
+
+
+def fix_comisiones(df, tabla):
+    """Calcula com_COD_VEND y com_VEND_FIRMA con la regla vigente en la FECHA_ALTA de cada fila."""
+    if 'FECHA_ALTA' not in df.columns:
+        raise ValueError("No se encontró la columna FECHA_ALTA: hace falta para elegir la regla de reparto.")
+    df['IMPORTE'] = pd.to_numeric(df['IMPORTE'], errors='coerce').fillna(0).round(2)
+    tasa = tasa_cod_vend(tabla, df['FECHA_ALTA'])
+    df['com_COD_VEND'] = (df['IMPORTE'] * tasa).round(2)
+    df['com_VEND_FIRMA'] = (df['IMPORTE'] - df['com_COD_VEND']).round(2)
+    return df
+
+
+def tramos(tabla, desde, hasta):
+    """Parte [desde, hasta) en tramos con una sola regla: [(inicio, fin, tasa)]."""
+    resultado = []
+    for regla in reglas(tabla):
+        inicio = max(desde, regla["desde"])
+        fin = hasta if regla["hasta"] is None else min(hasta, regla["hasta"])
+        if inicio < fin:
+            resultado.append((inicio, fin, regla["cod_vend"]))
+    return resultado
+
+
+def _intercalar(columnas):
+    """Intercala k Series de longitud n (a0, b0, a1, b1, ...) conservando el dtype."""
+    n = len(columnas[0])
+    orden = (np.arange(len(columnas)) * n + np.arange(n)[:, None]).ravel()
+    return pd.concat([c.reset_index(drop=True) for c in columnas], ignore_index=True).take(orden).reset_index(drop=True)
+
+
+def desdoblar_comisiones(df):
+    """
+    Convierte cada operación en dos filas (COD_VEND y VEND_FIRMA) con su parte de la comisión.
+
+    Se construye directamente el resultado en formato largo: cada columna se repite por
+    posición (np.repeat) y las columnas propias de cada mitad se intercalan, así que no se
+    copia el DataFrame completo ni hace falta ordenar para dejar juntas las dos mitades
+    de cada guid (quedan en el orden de entrada: COD_VEND y después VEND_FIRMA).
+    """
+    n = len(df)
+    repetir = np.repeat(np.arange(n), len(MITADES))
+
+    columnas = list(df.columns)
+    if 'IMPORTE_NUMERICO' not in columnas:
+        columnas.append('IMPORTE_NUMERICO')
+    for nueva in ['FUENTE', 'VENDEDOR', 'numPersonal', 'indice']:
+        if nueva not in columnas:
+            columnas.append(nueva)
+
+    propias = {
+        'IMPORTE_NUMERICO': df['IMPORTE'].take(repetir).reset_index(drop=True),  # conservar valor original
+        'FUENTE': pd.Series(np.tile([fuente for fuente, _, _ in MITADES], n)),
+        'IMPORTE': _intercalar([df[importe] for _, _, importe in MITADES]),
+        'VENDEDOR': _intercalar([df[vendedor] for _, vendedor, _ in MITADES]),
+    }
+    # numPersonal = VENDEDOR; índice = SAP + VENDEDOR
+    propias['numPersonal'] = propias['VENDEDOR']
+    propias['indice'] = df['SAP'].take(repetir).reset_index(drop=True) + propias['VENDEDOR']
+
+    salida = {}
+    for col in columnas:
+        if col in COLUMNAS_INTERMEDIAS:
+            continue
+        salida[col] = propias[col] if col in propias else df[col].take(repetir).reset_index(drop=True)
+    return pd.DataFrame(salida)
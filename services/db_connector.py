@@ -1,9 +1,17 @@
-import pyodbc
-from config import DB_CONFIG
-import time
+from config import DB_CONFIG, DB_POOL_SIZE
+import atexit
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+
+from services import bulk_writer
 
 
 def get_connection():
+    # Importación diferida: el pool y los servicios también se usan con SQLite (pruebas) sin ODBC instalado
+    import pyodbc
+
     conn_str = (
         f"DRIVER={{{DB_CONFIG['driver']}}};"
         f"SERVER={DB_CONFIG['server']};"
@@ -13,25 +21,146 @@ def get_connection():
     )
     return pyodbc.connect(conn_str)
 
-def insert_records(records, batch_size=500, pause_seconds=0):
-    conn = get_connection()
-    cursor = conn.cursor()
-    total = len(records)
-    for i in range(0, total, batch_size):
-        batch = records[i:i + batch_size]
-        print(f'📦 Insertando registros {i + 1} a {i + len(batch)} de {total}...')
-        for rec in batch:
-            cursor.execute("""
-                INSERT INTO dbo.finance_mes (
-                    FECHA_ALTA, SAP, NUMERO_SAP_VENDEDOR,
-                    IMPORTE_FINANCIADO, AÑO, MES, NUM_OPERACIONES
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, rec['FECHA_ALTA'], rec['SAP'], rec['NUMERO_SAP_VENDEDOR'],
-                 rec['IMPORTE_FINANCIADO'], rec['AÑO'], rec['MES'], rec['NUM_OPERACIONES'])
-        conn.commit()
-        # 😴 Pausa entre bloques
-        if pause_seconds > 0:
-            print(f"⏸️ Esperando {pause_seconds} segundos antes del siguiente lote...")
-            time.sleep(pause_seconds)
-    cursor.close()
-    conn.close()
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones reutilizables durante toda una ejecución.
+    Comprueba la salud de cada conexión antes de reutilizarla y cuenta
+    cuántas conexiones se han creado frente a cuántas se han reutilizado.
+    """
+
+    def __init__(self, factory=get_connection, max_size=DB_POOL_SIZE, health_query="SELECT 1"):
+        self._factory = factory
+        self._health_query = health_query
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self._health_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        """Devuelve una conexión sana del pool o crea una nueva si hay hueco libre."""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"⏳ Sin conexiones libres en el pool (máximo {self.max_size}).")
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self._is_healthy(conn):
+                    with self._lock:
+                        self.reused += 1
+                    return conn
+                self._discard(conn)
+            conn = self._factory()
+            with self._lock:
+                self.created += 1
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """Devuelve la conexión al pool deshaciendo cualquier transacción pendiente."""
+        try:
+            if discard:
+                self._discard(conn)
+                return
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def session(self, timeout=None):
+        conn = self.acquire(timeout=timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            # Si pyodbc no se ha importado, el error no puede venir de una conexión ODBC
+            pyodbc = sys.modules.get("pyodbc")
+            broken = pyodbc is not None and isinstance(e, pyodbc.Error) and not self._is_healthy(conn)
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        return {"created": self.created, "reused": self.reused, "discarded": self.discarded}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool compartido por todo el proceso (se crea en el primer uso)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+            atexit.register(_pool.close_all)
+        return _pool
+
+
+def session(timeout=None):
+    """
+    Context manager que presta una conexión del pool compartido:
+
+        with session() as conn:
+            ...
+    """
+    return get_pool().session(timeout=timeout)
+
+
+def print_pool_stats():
+    stats = get_pool().stats()
+    print(f"🔌 Conexiones creadas: {stats['created']} / reutilizadas: {stats['reused']}"
+          f" / descartadas: {stats['discarded']}")
+
+
+FINANCE_MES_COLUMNS = [
+    'FECHA_ALTA', 'SAP', 'NUMERO_SAP_VENDEDOR',
+    'IMPORTE_FINANCIADO', 'AÑO', 'MES', 'NUM_OPERACIONES'
+]
+
+def insert_records(records, batch_size=500, controller=None):
+    with session() as conn:
+        return bulk_writer.bulk_insert("dbo.finance_mes", FINANCE_MES_COLUMNS, records, conn=conn,
+                                       batch_size=batch_size, controller=controller)
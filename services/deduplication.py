@@ -1,30 +1,143 @@
-from services.db_connector import get_connection
+import numpy as np
+import pandas as pd
 
-def get_existing_keys():
+from services.bulk_writer import bulk_insert, create_temp_copy, is_sqlite
+
+KEY_COLUMNS = ['FECHA_ALTA', 'SAP', 'NUMERO_SAP_VENDEDOR', 'AÑO', 'MES']
+
+def key_frame(df):
     """
-    Devuelve un set con claves únicas existentes en la base de datos:
-    (FECHA_ALTA, SAP, NUMERO_SAP_VENDEDOR, AÑO, MES)
+    Columnas clave normalizadas para comparar archivo y BBDD de forma vectorizada:
+    FECHA_ALTA como texto (igual que str(datetime)), SAP como texto y el resto como float.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT FECHA_ALTA, SAP, NUMERO_SAP_VENDEDOR, AÑO, MES FROM dbo.finance_mes
-    """)
-    existing_keys = set()
-    for row in cursor.fetchall():
-        key = (str(row[0]), row[1], row[2], row[3], row[4])
-        existing_keys.add(key)
-    cursor.close()
-    conn.close()
-    return existing_keys
+    fecha = df['FECHA_ALTA']
+    if pd.api.types.is_datetime64_any_dtype(fecha):
+        fecha = fecha.dt.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        fecha = fecha.astype(str)
+    return pd.DataFrame({
+        'FECHA_ALTA': fecha.to_numpy(),
+        'SAP': df['SAP'].astype(str).to_numpy(),
+        'NUMERO_SAP_VENDEDOR': pd.to_numeric(df['NUMERO_SAP_VENDEDOR'], errors='coerce').astype('float64').to_numpy(),
+        'AÑO': pd.to_numeric(df['AÑO'], errors='coerce').astype('float64').to_numpy(),
+        'MES': pd.to_numeric(df['MES'], errors='coerce').astype('float64').to_numpy(),
+    })
 
-def filter_new_records(records, existing_keys):
+def existing_mask(df, existing):
+    """Máscara booleana de las filas de `df` cuya clave está en el DataFrame `existing` (hash join)."""
+    right = key_frame(existing).drop_duplicates()
+    merged = key_frame(df).merge(right, how='left', on=KEY_COLUMNS, indicator=True)
+    return merged['_merge'].eq('both').to_numpy()
+
+def filter_new_records(records, existing_keys, verify=None):
     """
     Filtra los registros que no estén en existing_keys.
+    Si `records` es un DataFrame el cruce es vectorizado y se devuelve un DataFrame.
+    existing_keys puede ser un set de tuplas, un DataFrame de claves o un HashedKeyStore
+    (en ese caso `verify` permite comprobar de forma exacta los posibles aciertos por colisión).
     """
+    if hasattr(existing_keys, 'filter_new'):
+        return existing_keys.filter_new(records, verify=verify)
+    if isinstance(records, pd.DataFrame):
+        if not isinstance(existing_keys, pd.DataFrame):
+            existing_keys = pd.DataFrame(list(existing_keys), columns=KEY_COLUMNS)
+        return records[~existing_mask(records, existing_keys)]
+
     new_records = []
     for r in records:
         key = (str(r['FECHA_ALTA']), r['SAP'], r['NUMERO_SAP_VENDEDOR'], r['AÑO'], r['MES'])
         if key not in existing_keys:
             new_records.append(r)
     return new_records
+
+
+# --- Deduplicación en servidor (anti-join) ---
+
+FINANCE_MES_TABLE = "dbo.finance_mes"
+DEDUP_INDEX = "IX_finance_mes_dedup"
+
+
+def ensure_dedup_index(conn, table=FINANCE_MES_TABLE):
+    """Crea (si no existe) el índice sobre la clave de deduplicación que usa el anti-join."""
+    cursor = conn.cursor()
+    cols = ", ".join(KEY_COLUMNS)
+    if is_sqlite(conn):
+        # En SQLite el esquema va en el nombre del índice, no en la tabla del ON
+        esquema, _, nombre = table.rpartition(".")
+        indice = f"{esquema}.{DEDUP_INDEX}" if esquema else DEDUP_INDEX
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {indice} ON {nombre} ({cols})")
+    else:
+        cursor.execute(f"""
+            IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = ? AND object_id = OBJECT_ID(?))
+                CREATE INDEX {DEDUP_INDEX} ON {table} ({cols})
+        """, (DEDUP_INDEX, table))
+    conn.commit()
+    cursor.close()
+
+
+def insert_new_records_server_side(records, conn, columns, table=FINANCE_MES_TABLE,
+                                   confirm=None, batch_size=5000):
+    """
+    Deduplica en la BBDD en lugar de descargar todas las claves:
+
+    1. Sube los registros candidatos a una tabla temporal.
+    2. Cuenta los que no existen en `table` (NOT EXISTS sobre KEY_COLUMNS).
+    3. Si confirm(n_nuevos) lo aprueba, hace INSERT ... SELECT ... WHERE NOT EXISTS.
+
+    El tráfico y la memoria dependen solo del archivo entrante. Devuelve las filas insertadas.
+    """
+    cursor = conn.cursor()
+    staging = create_temp_copy(cursor, conn, "finance_mes_candidatos", table, columns)
+    bulk_insert(staging, columns, records, conn=conn, batch_size=batch_size)
+
+    not_exists = f"""
+        NOT EXISTS (
+            SELECT 1 FROM {table} t
+            WHERE {" AND ".join(f"t.{c} = s.{c}" for c in KEY_COLUMNS)}
+        )
+    """
+    cursor.execute(f"SELECT COUNT(*) FROM {staging} s WHERE {not_exists}")
+    nuevos = cursor.fetchone()[0]
+    print(f'✅ {nuevos} registros nuevos encontrados (anti-join en servidor).')
+
+    insertados = 0
+    if nuevos and (confirm is None or confirm(nuevos)):
+        cols = ", ".join(columns)
+        cursor.execute(f"""
+            INSERT INTO {table} ({cols})
+            SELECT {", ".join(f"s.{c}" for c in columns)} FROM {staging} s
+            WHERE {not_exists}
+        """)
+        insertados = cursor.rowcount
+        conn.commit()
+        print(f"⚡ {insertados} registros insertados en {table}.")
+
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    conn.commit()
+    cursor.close()
+    return insertados
+
+
+def verify_existing_server_side(df, conn, table=FINANCE_MES_TABLE):
+    """
+    Verificación exacta en la BBDD: devuelve la máscara de filas de `df` cuya clave
+    existe realmente en `table`. Pensada para los aciertos de un HashedKeyStore.
+    """
+    cursor = conn.cursor()
+    staging = create_temp_copy(cursor, conn, "finance_mes_verificar", table, KEY_COLUMNS, row_id=True)
+    datos = {c: df[c] for c in KEY_COLUMNS}
+    datos['fila'] = range(len(df))
+    bulk_insert(staging, ['fila'] + KEY_COLUMNS, datos, conn=conn, batch_size=5000)
+    cursor.execute(f"""
+        SELECT s.fila FROM {staging} s
+        WHERE EXISTS (
+            SELECT 1 FROM {table} t
+            WHERE {" AND ".join(f"t.{c} = s.{c}" for c in KEY_COLUMNS)}
+        )
+    """)
+    mask = np.zeros(len(df), dtype=bool)
+    mask[[row[0] for row in cursor.fetchall()]] = True
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    conn.commit()
+    cursor.close()
+    return mask
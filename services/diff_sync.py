@@ -0,0 +1,87 @@
+from services.bulk_writer import bulk_insert, create_temp_copy, is_sqlite
+
+# Clave de cada fila de Datos_Normalizados: una operación (guid) y su mitad (FUENTE)
+DIFF_KEY = ['guid', 'FUENTE']
+
+
+def _row_hash(alias, columns):
+    """
+    Hash SHA-256 del contenido de la fila calculado en el servidor. Se serializa con
+    FOR JSON (nulos incluidos), que conserva fechas y decimales sin pérdida, y se aplica
+    la misma expresión a la tabla y a la tabla temporal, así que los tipos coinciden.
+    """
+    cols = ", ".join(f"{alias}.{c}" for c in columns)
+    return f"HASHBYTES('SHA2_256', (SELECT {cols} FOR JSON PATH, WITHOUT_ARRAY_WRAPPER, INCLUDE_NULL_VALUES))"
+
+
+def sync_diff(df, conn, table, columns, key=DIFF_KEY, batch_size=5000):
+    """
+    Sincroniza `table` con `df` tocando solo las filas que cambian, en vez de borrar y recargar:
+
+    1. Sube `df` a una tabla temporal.
+    2. Borra las filas de `table` cuya clave ya no está en el archivo.
+    3. Actualiza las filas con la misma clave cuyo hash de contenido difiere.
+    4. Inserta las claves nuevas.
+
+    Todo en una transacción. Devuelve {'insertados', 'actualizados', 'eliminados', 'sin_cambios'}.
+    """
+    cursor = conn.cursor()
+    staging = create_temp_copy(cursor, conn, "diff_staging", table, columns)
+    bulk_insert(staging, columns, df, conn=conn, batch_size=batch_size)
+
+    datos = [c for c in columns if c not in key]
+    misma_clave = " AND ".join(f"s.{c} = t.{c}" for c in key)
+
+    try:
+        if is_sqlite(conn):
+            # SQLite (pruebas): sin HASHBYTES, se compara columna a columna (IS NOT es null-safe)
+            cursor.execute(f"DELETE FROM {table} AS t WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE {misma_clave})")
+            eliminados = cursor.rowcount
+            distinto = " OR ".join(f"t.{c} IS NOT s.{c}" for c in datos)
+            cursor.execute(f"""
+                UPDATE {table} AS t SET {", ".join(f"{c} = s.{c}" for c in datos)}
+                FROM {staging} s
+                WHERE {misma_clave} AND ({distinto})
+            """)
+            actualizados = cursor.rowcount
+        else:
+            cursor.execute(f"""
+                DELETE t FROM {table} t
+                WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE {misma_clave})
+            """)
+            eliminados = cursor.rowcount
+            cursor.execute(f"""
+                UPDATE t SET {", ".join(f"{c} = s.{c}" for c in datos)}
+                FROM {table} t
+                JOIN {staging} s ON {misma_clave}
+                WHERE {_row_hash("t", datos)} <> {_row_hash("s", datos)}
+            """)
+            actualizados = cursor.rowcount
+
+        cols = ", ".join(columns)
+        cursor.execute(f"""
+            INSERT INTO {table} ({cols})
+            SELECT {", ".join(f"s.{c}" for c in columns)} FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {misma_clave})
+        """)
+        insertados = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        conn.commit()
+        cursor.close()
+
+    resultado = {
+        "insertados": insertados,
+        "actualizados": actualizados,
+        "eliminados": eliminados,
+        "sin_cambios": len(df) - insertados - actualizados,
+    }
+    print(f"   ➕ Insertados:   {insertados}")
+    print(f"   🔁 Actualizados: {actualizados}")
+    print(f"   🗑️ Eliminados:   {eliminados}")
+    print(f"   ⏸️ Sin cambios:  {resultado['sin_cambios']}")
+    return resultado
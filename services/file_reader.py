@@ -1,15 +1,12 @@
 import pandas as pd
 import os
 
-# Mapeo: columnas del archivo → columnas destino en BD
-EXPECTED_COLUMNS = {
-    'year': 'AÑO',
-    'month': 'MES',
-    'sap_code': 'SAP',
-    'salesperson_no': 'NUMERO_SAP_VENDEDOR',
-    'operations': 'NUM_OPERACIONES',
-    'amount': 'IMPORTE_FINANCIADO'
-}
+from services.parse_cache import cached_parse
+from services.xlsx_reader import is_xlsx, iter_xlsx_batches, read_xlsx
+from services.schemas import FINANCE_MES, new_report, parse_frame, print_report
+
+# Mapeo: columnas del archivo → columnas destino en BD (definido en services/schemas)
+EXPECTED_COLUMNS = {spec['origen']: destino for destino, spec in FINANCE_MES['columnas'].items()}
 
 def get_excel_or_csv_files(folder_path):
     return [
@@ -18,84 +15,80 @@ def get_excel_or_csv_files(folder_path):
         if f.lower().endswith(('.csv', '.xls', '.xlsx'))
     ]
 
-def read_file(file_path):
-    # Leer archivo según extensión
-    if file_path.endswith('.csv'):
-        df = pd.read_csv(file_path, sep=';', dtype=str)
-    else:
-        df = pd.read_excel(file_path)
+# Campos obligatorios: se descartan las filas con alguno de ellos nulo
+CAMPOS_CLAVE = FINANCE_MES['obligatorias']
 
-    # Normalizar nombres de columnas del archivo
-    df.columns = [c.strip().lower().replace(' ', '_') for c in df.columns]
-
-    # Verificar columnas necesarias originales
-    missing_originals = [orig for orig in EXPECTED_COLUMNS if orig not in df.columns]
-    if missing_originals:
-        raise ValueError(f"❌ Faltan columnas en el archivo {file_path}: {missing_originals}")
+# Filas por bloque en el modo streaming de CSV
+CHUNK_SIZE = 100_000
 
-    # Renombrar columnas del archivo → modelo destino
-    rename_map = {orig: dest for orig, dest in EXPECTED_COLUMNS.items()}
-    df = df.rename(columns=rename_map)
+# Versión de la limpieza de read_file: cambiarla invalida la caché de lecturas
+PARSE_VERSION = "finance_mes-2"
 
-    # Inspección rápida de valores que fallarán al convertir IMPORTE_FINANCIADO
-    # temp = df.copy()
+def _normalize_column(c):
+    return c.strip().lower().replace(' ', '_')
 
-    # # Normalizar texto
-    # temp['IMPORTE_SANITIZED'] = temp['IMPORTE_FINANCIADO'].astype(str).str.strip().replace('', pd.NA)
-    # temp['IMPORTE_SANITIZED'] = temp['IMPORTE_SANITIZED'].str.replace(',', '.', regex=False)
+def new_diagnostics():
+    """Informe de rechazos acumulable entre bloques."""
+    return new_report(FINANCE_MES)
 
-    # # Intento de conversión
-    # temp['IMPORTE_VALIDO'] = pd.to_numeric(temp['IMPORTE_SANITIZED'], errors='coerce')
+def print_diagnostics(stats):
+    print_report(stats)
 
-    # # Filtrar solo los que fallarán
-    # errores = temp[temp['IMPORTE_VALIDO'].isna()]
+def clean_frame(df, file_path, stats):
+    """Tipa y filtra un DataFrame (o un bloque) del archivo según el esquema FINANCE_MES, acumulando el diagnóstico en `stats`."""
+    # Normalizar nombres de columnas del archivo
+    df.columns = [_normalize_column(c) for c in df.columns]
 
-    # # Mostrar resumen
-    # print(f"🔎 Total registros en archivo: {len(temp)}")
-    # print(f"❌ IMPORTE_FINANCIADO inválido en: {len(errores)} registros")
-    # print("📋 Ejemplos de errores:")
-    # print(errores[['IMPORTE_FINANCIADO']].head(10))
+    # Conversión de cada columna en una sola pasada (separadores, nulos 'N/A', etc.)
+    df, stats = parse_frame(df, FINANCE_MES, stats, nombre=file_path)
 
     # Añadir columna fija FECHA_ALTA
     df['FECHA_ALTA'] = pd.Timestamp('1900-01-01')
 
     # Reordenar columnas
     ordered_columns = ['FECHA_ALTA', 'SAP', 'NUMERO_SAP_VENDEDOR', 'IMPORTE_FINANCIADO', 'AÑO', 'MES', 'NUM_OPERACIONES']
-    df = df[ordered_columns]
-
-    # Limpieza y diagnóstico
-    original_len = len(df)
-
-    # Convertir NUMERO_SAP_VENDEDOR (descartar si NaN o no numérico)
-    # Reemplazar N/A y vacíos por 0
-    df['NUMERO_SAP_VENDEDOR'] = df['NUMERO_SAP_VENDEDOR'].replace(['N/A', 'n/a', '', None], '0')
+    return df[ordered_columns]
 
-    # Convertir a numérico (0 incluidos)
-    df['NUMERO_SAP_VENDEDOR'] = pd.to_numeric(df['NUMERO_SAP_VENDEDOR'], errors='coerce').fillna(0)
-
-    df['IMPORTE_FINANCIADO'] = df['IMPORTE_FINANCIADO'].astype(str).str.strip()
-    df['IMPORTE_FINANCIADO'] = df['IMPORTE_FINANCIADO'].str.replace('.', '', regex=False)  # quitar separador de miles
-    df['IMPORTE_FINANCIADO'] = df['IMPORTE_FINANCIADO'].str.replace(',', '.', regex=False)  # coma decimal → punto
-    df['IMPORTE_FINANCIADO'] = pd.to_numeric(df['IMPORTE_FINANCIADO'], errors='coerce')
-
-    # Convertir otros campos numéricos
-    df['NUM_OPERACIONES'] = pd.to_numeric(df['NUM_OPERACIONES'], errors='coerce')
-    df['AÑO'] = pd.to_numeric(df['AÑO'], errors='coerce')
-    df['MES'] = pd.to_numeric(df['MES'], errors='coerce')
-
-    # Diagnóstico por campo
-    campos_clave = ['SAP', 'IMPORTE_FINANCIADO', 'AÑO', 'MES', 'NUM_OPERACIONES']
-    for campo in campos_clave:
-        nulos = df[campo].isna().sum()
-        if nulos > 0:
-            print(f"⚠️ {nulos} registros con valor nulo en {campo}")
-
-    # Eliminar filas con datos obligatorios nulos
-    df = df.dropna(subset=campos_clave)
+def parse_file(file_path):
+    # Leer archivo según extensión
+    if file_path.endswith('.csv'):
+        df = pd.read_csv(file_path, sep=';', dtype=str, engine='c',
+                         usecols=lambda c: _normalize_column(c) in EXPECTED_COLUMNS)
+    elif is_xlsx(file_path):
+        # Lectura en streaming: solo las columnas esperadas, sin cargar el libro completo
+        df = read_xlsx(file_path, columns=list(EXPECTED_COLUMNS), header_transform=_normalize_column)
+    else:
+        df = pd.read_excel(file_path)
 
-    final_len = len(df)
-    descartados = original_len - final_len
-    if descartados > 0:
-        print(f"⚠️ {descartados} registros descartados por valores inválidos.")
+    stats = new_diagnostics()
+    df = clean_frame(df, file_path, stats)
+    print_diagnostics(stats)
+    return df
 
-    return df.to_dict(orient='records')
+def read_file(file_path):
+    """Lee y limpia el archivo, reutilizando la lectura anterior si el contenido no ha cambiado."""
+    return cached_parse(file_path, parse_file, PARSE_VERSION)
+
+def read_file_chunks(file_path, chunksize=CHUNK_SIZE, stats=None):
+    """
+    Versión en streaming de read_file: genera DataFrames limpios de como mucho `chunksize` filas.
+    Los CSV se leen por bloques (y solo las columnas esperadas), así que la memoria no crece
+    con el tamaño del archivo. Los .xlsx se leen fila a fila con openpyxl en modo read-only
+    (ver xlsx_reader); los .xls antiguos se leen enteros y se entregan en un único bloque.
+    El diagnóstico se acumula entre bloques y se imprime al terminar.
+    """
+    stats = stats if stats is not None else new_diagnostics()
+    if file_path.endswith('.csv'):
+        reader = pd.read_csv(file_path, sep=';', dtype=str, engine='c', chunksize=chunksize,
+                             usecols=lambda c: _normalize_column(c) in EXPECTED_COLUMNS)
+        with reader:
+            for chunk in reader:
+                yield clean_frame(chunk, file_path, stats)
+    elif is_xlsx(file_path):
+        for chunk in iter_xlsx_batches(file_path, columns=list(EXPECTED_COLUMNS), batch_size=chunksize,
+                                       header_transform=_normalize_column):
+            yield clean_frame(chunk, file_path, stats)
+    else:
+        yield clean_frame(pd.read_excel(file_path), file_path, stats)
+    print(f"🔎 {stats['total']} registros leídos en streaming.")
+    print_diagnostics(stats)
@@ -0,0 +1,188 @@
+import json
+import os
+
+import pandas as pd
+
+from config import KEY_INDEX_DIR
+from services.db_connector import session
+from services.key_store import HashedKeyStore, hash_keys
+from services.sql_reader import fetch_hashes
+
+TABLE_NAME = "dbo.finance_mes"
+KEY_COLUMNS = ['FECHA_ALTA', 'SAP', 'NUMERO_SAP_VENDEDOR', 'AÑO', 'MES']
+
+# Parejas (AÑO, MES) por consulta, para no pasar del límite de parámetros
+PARTITIONS_PER_QUERY = 500
+
+# Versión del formato en disco (2 = hashes en .npy en lugar de sets serializados)
+INDEX_FORMAT = 2
+
+
+def partitions_of(records):
+    """Particiones (AÑO, MES) presentes en un DataFrame de registros."""
+    parts = records[['AÑO', 'MES']].drop_duplicates()
+    return {(int(año), int(mes)) for año, mes in parts.itertuples(index=False)}
+
+
+class KeyIndex:
+    """
+    Índice local y persistente de las claves de dbo.finance_mes, particionado por (AÑO, MES).
+
+    Cada partición se guarda en disco como un HashedKeyStore (array ordenado de hashes
+    de la clave normalizada) junto con el COUNT(*) y el CHECKSUM_AGG que
+    tenía en la BBDD. Antes de deduplicar solo se consultan esos agregados para las
+    particiones del archivo entrante y solo se vuelven a descargar las que no cuadran
+    (la tabla se ha modificado fuera del pipeline).
+    """
+
+    def __init__(self, folder=KEY_INDEX_DIR, table=TABLE_NAME):
+        self.folder = folder
+        self.table = table
+        self._manifest_path = os.path.join(folder, "manifest.json")
+        self._manifest = self._load_manifest()
+        self._partitions = {}
+
+    # --- Persistencia local ---
+
+    def _load_manifest(self):
+        if not os.path.exists(self._manifest_path):
+            return {}
+        with open(self._manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != INDEX_FORMAT:
+            # Índice con formato antiguo: se reconstruye desde la BBDD
+            return {}
+        return manifest.get("partitions", {})
+
+    def _save_manifest(self):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"format": INDEX_FORMAT, "partitions": self._manifest}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._manifest_path)
+
+    @staticmethod
+    def _name(partition):
+        return f"{partition[0]}-{partition[1]:02d}"
+
+    def _partition_path(self, partition):
+        return os.path.join(self.folder, f"{self._name(partition)}.npy")
+
+    def _has_local(self, partition):
+        """La partición está en memoria o en disco: el manifiesto por sí solo no basta."""
+        return partition in self._partitions or os.path.exists(self._partition_path(partition))
+
+    def _load_partition(self, partition):
+        if partition not in self._partitions:
+            path = self._partition_path(partition)
+            if os.path.exists(path):
+                self._partitions[partition] = HashedKeyStore.load(path)
+            else:
+                self._partitions[partition] = HashedKeyStore()
+        return self._partitions[partition]
+
+    def _save_partition(self, partition, keys, stats):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._partition_path(partition)
+        keys.save(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self._partitions[partition] = keys
+        self._manifest[self._name(partition)] = {"rows": stats[0], "checksum": stats[1]}
+
+    # --- Consultas a BBDD ---
+
+    def _server_stats(self, cursor, partitions):
+        """Devuelve {(AÑO, MES): (filas, checksum)} de la BBDD para las particiones pedidas."""
+        partitions = sorted(partitions)
+        stats = {}
+        for i in range(0, len(partitions), PARTITIONS_PER_QUERY):
+            chunk = partitions[i:i + PARTITIONS_PER_QUERY]
+            where = " OR ".join(["(AÑO = ? AND MES = ?)"] * len(chunk))
+            params = [value for partition in chunk for value in partition]
+            cursor.execute(f"""
+                SELECT AÑO, MES, COUNT(*),
+                       CHECKSUM_AGG(BINARY_CHECKSUM(FECHA_ALTA, SAP, NUMERO_SAP_VENDEDOR))
+                FROM {self.table}
+                WHERE {where}
+                GROUP BY AÑO, MES
+            """, params)
+            for año, mes, filas, checksum in cursor.fetchall():
+                stats[(int(año), int(mes))] = (filas, checksum)
+        return stats
+
+    def _download_partition(self, cursor, partition):
+        hashes = fetch_hashes(cursor, f"""
+            SELECT FECHA_ALTA, SAP, NUMERO_SAP_VENDEDOR, AÑO, MES
+            FROM {self.table}
+            WHERE AÑO = ? AND MES = ?
+        """, (partition[0], partition[1]), hasher=hash_keys, nombre=f"Claves {self._name(partition)}")
+        return HashedKeyStore(hashes)
+
+    # --- API ---
+
+    def existing_keys(self, records):
+        """
+        Devuelve un HashedKeyStore con las claves existentes de las particiones presentes
+        en `records`, refrescando desde la BBDD solo las particiones desactualizadas.
+        """
+        partitions = partitions_of(records)
+        if not partitions:
+            return HashedKeyStore()
+
+        with session() as conn:
+            cursor = conn.cursor()
+            stats = self._server_stats(cursor, partitions)
+            refreshed = 0
+            for partition in partitions:
+                server = stats.get(partition, (0, None))
+                local = self._manifest.get(self._name(partition))
+                # Sin el .npy (borrado, copia a medias) la partición se da por desactualizada
+                if local is not None and self._has_local(partition) and (local["rows"], local["checksum"]) == server:
+                    continue
+                keys = self._download_partition(cursor, partition) if server[0] else HashedKeyStore()
+                self._save_partition(partition, keys, server)
+                refreshed += 1
+            cursor.close()
+        self._save_manifest()
+
+        print(f"🗂️ Índice de claves: {len(partitions)} particiones (AÑO, MES), {refreshed} refrescadas desde BBDD.")
+        existing = HashedKeyStore.concat(self._load_partition(p) for p in partitions)
+        print(existing.memory_report())
+        return existing
+
+    def add(self, records):
+        """
+        Añade al índice las claves recién insertadas y guarda los agregados actuales
+        de sus particiones, para que la siguiente ejecución no tenga que descargarlas.
+        """
+        if records.empty:
+            return
+        partitions = pd.MultiIndex.from_arrays([
+            records['AÑO'].astype(int).to_numpy(), records['MES'].astype(int).to_numpy()
+        ])
+
+        with session() as conn:
+            cursor = conn.cursor()
+            stats = self._server_stats(cursor, set(partitions.unique()))
+            for partition in partitions.unique():
+                clave = (int(partition[0]), int(partition[1]))
+                if self._has_local(clave):
+                    store = self._load_partition(clave)
+                    store.add(records[partitions == partition])
+                else:
+                    # Sin archivo local no se parte de vacío: se descarga entera (ya incluye lo insertado)
+                    store = self._download_partition(cursor, clave)
+                self._save_partition(clave, store, stats.get(clave, (0, None)))
+            cursor.close()
+        self._save_manifest()
+
+
+_index = None
+
+
+def get_key_index():
+    """Índice compartido por todo el proceso (se crea en el primer uso)."""
+    global _index
+    if _index is None:
+        _index = KeyIndex()
+    return _index
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from services.deduplication import key_frame
+
+# Claves de hash independientes para las dos mitades del hash de 128 bits
+HASH_KEY_LO = "0123456789123456"
+HASH_KEY_HI = "finance_mes_keys"
+
+HASH_DTYPE_128 = np.dtype([('hi', '<u8'), ('lo', '<u8')])
+
+
+def hash_keys(df, bits=64):
+    """
+    Hash vectorizado de la clave normalizada (ver deduplication.key_frame) de cada fila.
+    Devuelve un array uint64 (bits=64) o estructurado hi/lo (bits=128).
+    """
+    keys = key_frame(df)
+    lo = pd.util.hash_pandas_object(keys, index=False, hash_key=HASH_KEY_LO).to_numpy(np.uint64)
+    if bits == 64:
+        return lo
+    out = np.empty(len(lo), dtype=HASH_DTYPE_128)
+    out['lo'] = lo
+    out['hi'] = pd.util.hash_pandas_object(keys, index=False, hash_key=HASH_KEY_HI).to_numpy(np.uint64)
+    return out
+
+
+class HashedKeyStore:
+    """
+    Conjunto compacto de claves existentes: array ordenado de hashes de 64 (o 128) bits
+    en lugar de un set de tuplas Python. Ocupa 8 (o 16) bytes por clave y las
+    comprobaciones de pertenencia son vectorizadas (búsqueda binaria con searchsorted).
+
+    Un hash puede colisionar: contains() puede dar algún falso "ya existe", nunca un
+    falso "nuevo". filter_new() admite un paso de verificación exacta para esos aciertos.
+    """
+
+    def __init__(self, hashes=None, bits=64):
+        self.bits = bits
+        dtype = np.uint64 if bits == 64 else HASH_DTYPE_128
+        if hashes is None:
+            hashes = np.empty(0, dtype=dtype)
+        self.hashes = np.unique(np.asarray(hashes, dtype=dtype))
+
+    @classmethod
+    def from_frame(cls, df, bits=64):
+        return cls(hash_keys(df, bits=bits), bits=bits)
+
+    @classmethod
+    def concat(cls, stores, bits=64):
+        stores = list(stores)
+        if not stores:
+            return cls(bits=bits)
+        return cls(np.concatenate([s.hashes for s in stores]), bits=stores[0].bits)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @property
+    def nbytes(self):
+        return self.hashes.nbytes
+
+    def contains_hashes(self, hashes):
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        pos = np.searchsorted(self.hashes, hashes)
+        pos[pos == len(self.hashes)] = 0
+        return self.hashes[pos] == hashes
+
+    def contains(self, df):
+        """Máscara booleana de las filas de `df` cuya clave (probablemente) ya existe."""
+        return self.contains_hashes(hash_keys(df, bits=self.bits))
+
+    def add(self, df):
+        self.hashes = np.union1d(self.hashes, hash_keys(df, bits=self.bits))
+
+    def filter_new(self, df, verify=None):
+        """
+        Devuelve las filas de `df` que no están en el almacén.
+        verify(df_aciertos) -> máscara de las que existen de verdad; las que no,
+        son colisiones de hash y se devuelven como nuevas.
+        """
+        mask = self.contains(df)
+        if verify is not None and mask.any():
+            hits = np.flatnonzero(mask)
+            really = np.asarray(verify(df.iloc[hits]), dtype=bool)
+            collisions = hits[~really]
+            if len(collisions):
+                print(f"🔎 {len(collisions)} colisiones de hash descartadas en la verificación exacta.")
+            mask[collisions] = False
+        return df[~mask]
+
+    def memory_report(self):
+        tuple_estimate = len(self) * 400  # ~400 bytes por tupla de 5 elementos con sus objetos
+        return (f"🧮 Almacén de claves: {len(self):,} hashes de {self.bits} bits = "
+                f"{self.nbytes / 1024 ** 2:.1f} MB (un set de tuplas rondaría {tuple_estimate / 1024 ** 2:.0f} MB)")
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.save(f, self.hashes, allow_pickle=False)
+
+    @classmethod
+    def load(cls, path, bits=64):
+        return cls(np.load(path, allow_pickle=False), bits=bits)
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import time
+
+import pandas as pd
+
+from config import PARSE_CACHE_DIR, PARSE_CACHE_MAX_MB
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET = True
+except ImportError:
+    PARQUET = False
+
+# Bloque de lectura para calcular el hash del archivo
+HASH_BLOCK = 1024 * 1024
+
+# Antigüedad (segundos) a partir de la cual un .tmp se da por abandonado
+TMP_MAX_AGE = 3600
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def file_digest(path):
+    """SHA-256 del contenido del archivo (no depende del nombre ni de la fecha)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class ParseCache:
+    """
+    Caché local de DataFrames ya leídos y limpiados, indexada por el hash del contenido
+    del archivo y la versión de la cadena de transformación que los produjo.
+
+    Se guardan en parquet (pyarrow) y, si no está disponible o el DataFrame no se puede
+    representar en parquet, en pickle. Al superar `max_mb` se borran las entradas
+    usadas hace más tiempo (LRU por fecha de último uso del archivo).
+    """
+
+    def __init__(self, folder=PARSE_CACHE_DIR, max_mb=PARSE_CACHE_MAX_MB):
+        self.folder = folder
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def _paths(self, key):
+        base = os.path.join(self.folder, key)
+        return base + ".parquet", base + ".pkl"
+
+    def key(self, path, version):
+        return f"{version}-{file_digest(path)}"
+
+    def get(self, key):
+        parquet_path, pickle_path = self._paths(key)
+        try:
+            if PARQUET and os.path.exists(parquet_path):
+                df = pd.read_parquet(parquet_path)
+                os.utime(parquet_path)
+                return df
+            if os.path.exists(pickle_path):
+                with open(pickle_path, "rb") as f:
+                    df = pickle.load(f)
+                os.utime(pickle_path)
+                return df
+        except Exception as e:
+            # Entrada corrupta o a medio escribir: se ignora y se vuelve a leer el archivo
+            print(f"⚠️ Caché de lectura inválida ({key}): {e}")
+        return None
+
+    def put(self, key, df):
+        os.makedirs(self.folder, exist_ok=True)
+        parquet_path, pickle_path = self._paths(key)
+        destino = None
+        if PARQUET:
+            try:
+                df.to_parquet(parquet_path + ".tmp", index=False)
+                destino = parquet_path
+            except Exception:
+                # Columnas con tipos mezclados que parquet no admite: se guarda en pickle
+                _remove(parquet_path + ".tmp")
+                destino = None
+        if destino is None:
+            try:
+                with open(pickle_path + ".tmp", "wb") as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                _remove(pickle_path + ".tmp")
+                raise
+            destino = pickle_path
+        os.replace(destino + ".tmp", destino)
+        self.evict()
+
+    def evict(self):
+        """
+        Borra las entradas menos usadas recientemente hasta quedar por debajo del límite,
+        y los .tmp abandonados por escrituras interrumpidas.
+        """
+        entradas = []
+        ahora = time.time()
+        for nombre in os.listdir(self.folder):
+            if nombre.endswith(".tmp"):
+                ruta = os.path.join(self.folder, nombre)
+                try:
+                    # Solo los antiguos: uno reciente puede ser la escritura en curso de otro proceso
+                    if ahora - os.stat(ruta).st_mtime > TMP_MAX_AGE:
+                        os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not nombre.endswith((".parquet", ".pkl")):
+                continue
+            ruta = os.path.join(self.folder, nombre)
+            try:
+                st = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, ruta))
+
+        total = sum(size for _, size, _ in entradas)
+        for _, size, ruta in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def load_or_parse(self, path, parse, version):
+        """Devuelve el DataFrame en caché para `path` o lo genera con parse(path) y lo guarda."""
+        key = self.key(path, version)
+        df = self.get(key)
+        if df is not None:
+            print(f"♻️ {os.path.basename(path)} sin cambios: se reutiliza la lectura en caché.")
+            return df
+        df = parse(path)
+        try:
+            self.put(key, df)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar la lectura en caché: {e}")
+        return df
+
+
+def cached_parse(path, parse, version):
+    """Atajo: lectura con la caché por defecto (se desactiva con PARSE_CACHE_MAX_MB=0)."""
+    if PARSE_CACHE_MAX_MB <= 0:
+        return parse(path)
+    return ParseCache().load_or_parse(path, parse, version)
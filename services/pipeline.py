@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+_FIN = object()
+
+
+def default_workers():
+    """Procesos de lectura por defecto: uno por núcleo disponible."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def iter_parsed(paths, parse, workers=1):
+    """
+    Genera (path, resultado, error) en el mismo orden que `paths`.
+
+    Con workers > 1 la lectura/limpieza se reparte en un pool de procesos
+    (parse debe ser una función de módulo, serializable). Solo se mantienen
+    en vuelo `2 * workers` archivos para no acumular resultados en memoria.
+    """
+    if workers <= 1:
+        for path in paths:
+            try:
+                yield path, parse(path), None
+            except Exception as e:
+                yield path, None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        en_vuelo = deque()
+        pendientes = iter(paths)
+        for path in pendientes:
+            en_vuelo.append((path, pool.submit(parse, path)))
+            if len(en_vuelo) >= 2 * workers:
+                break
+        while en_vuelo:
+            path, futuro = en_vuelo.popleft()
+            siguiente = next(pendientes, None)
+            if siguiente is not None:
+                en_vuelo.append((siguiente, pool.submit(parse, siguiente)))
+            try:
+                yield path, futuro.result(), None
+            except Exception as e:
+                yield path, None, e
+
+
+def pipeline_args(argv):
+    """Lee --pipeline y --workers N (o --workers sin número = un proceso por núcleo) de la línea de comandos."""
+    workers = 1
+    if "--workers" in argv:
+        idx = argv.index("--workers")
+        valor = argv[idx + 1] if idx + 1 < len(argv) else ""
+        workers = int(valor) if valor.isdigit() else default_workers()
+    return "--pipeline" in argv, workers
+
+
+def run_pipeline(paths, parse, write, max_pending=1, workers=1):
+    """
+    Ejecuta lectura/transformación y escritura solapadas:
+
+    - parse(path) corre en un hilo aparte y deja el resultado en una cola acotada.
+    - write(path, resultado) corre en el hilo que llama, archivo a archivo y en orden.
+
+    Mientras se escribe el archivo N se prepara el N+1. Con la cola llena el hilo
+    lector se bloquea (backpressure), así que como mucho hay en memoria el archivo
+    que se escribe, `max_pending` en cola y el que se está leyendo.
+
+    Con workers > 1 la etapa de lectura usa un pool de procesos (ver iter_parsed).
+    Un error al leer un archivo se informa y ese archivo se salta (no se mueve);
+    un error al escribir detiene el pipeline y se propaga.
+    Devuelve la lista de (path, error) de los archivos que no se pudieron leer.
+    """
+    pendientes = queue.Queue(maxsize=max_pending)
+    parar = threading.Event()
+    fallidos = []
+
+    def lector():
+        try:
+            for item in iter_parsed(paths, parse, workers=workers):
+                if parar.is_set():
+                    break
+                while not parar.is_set():
+                    try:
+                        pendientes.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            pendientes.put(_FIN)
+
+    hilo = threading.Thread(target=lector, name="pipeline-lector", daemon=True)
+    hilo.start()
+    try:
+        while True:
+            item = pendientes.get()
+            if item is _FIN:
+                break
+            path, resultado, error = item
+            if error is not None:
+                print(f"❌ Error leyendo {os.path.basename(path)}: {error}")
+                fallidos.append((path, error))
+                continue
+            write(path, resultado)
+    finally:
+        parar.set()
+        # Vaciar la cola para desbloquear al lector si el escritor ha fallado
+        while hilo.is_alive():
+            try:
+                pendientes.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        hilo.join()
+    return fallidos
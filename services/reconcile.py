@@ -0,0 +1,88 @@
+import hashlib
+import json
+import math
+import os
+from datetime import datetime
+
+from config import LOAD_REPORT_PATH
+
+
+class LoadStats:
+    """
+    Totales acumulados por bulk_insert lote a lote mientras carga: filas, suma del
+    importe y un hash encadenado de los lotes enviados (huella de la carga).
+    """
+
+    def __init__(self, amount_column=None):
+        self.amount_column = amount_column
+        self.rows = 0
+        self.amount = 0.0
+        self.batches = 0
+        self._amount_idx = None
+        self._hash = hashlib.sha256()
+
+    def bind(self, columns):
+        """Lo llama bulk_insert con las columnas en el orden de las filas que va a enviar."""
+        columns = list(columns)
+        self._amount_idx = columns.index(self.amount_column) if self.amount_column in columns else None
+
+    def add_batch(self, rows):
+        """Acumula un lote ya confirmado (solo las filas que se insertaron)."""
+        self.rows += len(rows)
+        self.batches += 1
+        if self._amount_idx is not None:
+            self.amount = math.fsum([self.amount] + [r[self._amount_idx] or 0 for r in rows])
+        self._hash.update(repr(rows).encode("utf-8"))
+
+    @property
+    def digest(self):
+        return self._hash.hexdigest()
+
+
+def write_report(report, path=LOAD_REPORT_PATH):
+    """Añade el informe como una línea JSON (un registro por carga)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False, default=str) + "\n")
+
+
+def reconcile(conn, table, stats, where="1 = 1", params=(), scope="", tolerance=0.01):
+    """
+    Compara lo que el escritor dice haber insertado con un único agregado en la BBDD
+    limitado a las filas de esta carga (`where`, p. ej. el rango de fechas del mes).
+    Escribe el resultado en el informe de cargas y lo devuelve.
+    """
+    cursor = conn.cursor()
+    if stats.amount_column:
+        cursor.execute(f"SELECT COUNT(*), SUM({stats.amount_column}) FROM {table} WHERE {where}", params)
+        filas_db, importe_db = cursor.fetchone()
+        importe_db = float(importe_db or 0)
+    else:
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params)
+        filas_db, importe_db = cursor.fetchone()[0], None
+    cursor.close()
+
+    ok = filas_db == stats.rows and (
+        importe_db is None or math.isclose(importe_db, stats.amount, abs_tol=tolerance)
+    )
+    report = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "tabla": table,
+        "alcance": scope,
+        "lotes": stats.batches,
+        "filas_enviadas": stats.rows,
+        "filas_bbdd": filas_db,
+        "importe_enviado": round(stats.amount, 2) if stats.amount_column else None,
+        "importe_bbdd": round(importe_db, 2) if importe_db is not None else None,
+        "hash_carga": stats.digest,
+        "ok": ok,
+    }
+    write_report(report)
+
+    if ok:
+        print(f"✅ Conciliación {table} ({scope}): {filas_db} filas"
+              + (f" / {importe_db:.2f}" if importe_db is not None else "") + " cuadran con lo enviado.")
+    else:
+        print(f"❌ Conciliación {table} ({scope}): enviado {stats.rows} filas / {stats.amount:.2f}, "
+              f"en BBDD {filas_db} filas" + (f" / {importe_db:.2f}" if importe_db is not None else "") + ".")
+    return report
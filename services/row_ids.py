@@ -0,0 +1,41 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# Longitud del identificador (misma que el uuid4().hex[:12] que se usaba antes)
+GUID_LEN = 12
+
+
+def file_fingerprint(path):
+    """
+    Huella del archivo usada como sal del hash: depende del nombre, no del contenido,
+    para que al corregir una línea del archivo el resto de filas conserve su guid.
+    """
+    nombre = os.path.basename(path).strip().lower()
+    return hashlib.sha256(nombre.encode("utf-8")).hexdigest()[:16]
+
+
+def row_guids(df, path):
+    """
+    Identificador determinista de cada fila: hash vectorizado del contenido de la fila
+    original, salado con la huella del archivo. Las filas repetidas se distinguen por
+    su número de aparición, así que volver a importar el mismo archivo da los mismos guids.
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    sal = file_fingerprint(path)
+    contenido = pd.util.hash_pandas_object(df, index=False, hash_key=sal).to_numpy()
+    aparicion = np.zeros(len(contenido), dtype=np.uint64)
+    repetidas = pd.Series(contenido).duplicated(keep=False).to_numpy()
+    if repetidas.any():
+        # Solo las filas repetidas necesitan su número de aparición
+        sub = contenido[repetidas]
+        aparicion[repetidas] = pd.Series(sub).groupby(sub).cumcount().to_numpy()
+    claves = pd.DataFrame({'contenido': contenido, 'aparicion': aparicion})
+    h = pd.util.hash_pandas_object(claves, index=False, hash_key=sal).to_numpy()
+
+    # uint64 → hexadecimal de 16 caracteres de una vez, recortado a GUID_LEN
+    hexa = np.frombuffer(h.astype('>u8').tobytes().hex().encode('ascii'), dtype='S16')
+    return pd.Series(hexa.astype(f'S{GUID_LEN}').astype(str), index=df.index, dtype=object)
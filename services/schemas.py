@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_numeric_dtype, is_datetime64_any_dtype
+
+# Valores que se tratan como vacíos en cualquier columna
+NULOS = ('', 'N/A', 'n/a')
+
+# Tablas de str.translate: una sola pasada por valor para separadores y símbolos
+_TRADUCCIONES = {
+    'numero': None,
+    'decimal': str.maketrans({',': '.'}),                    # coma decimal → punto
+    'decimal_es': str.maketrans({'.': None, ',': '.'}),      # 1.234,56 → 1234.56
+    'porcentaje': str.maketrans({'%': None, ',': '.'}),      # 12,5% → 12.5
+}
+
+# Normalización de cabeceras de archivo
+CABECERAS = {
+    'snake': lambda c: str(c).strip().lower().replace(' ', '_'),
+    'upper_snake': lambda c: str(c).strip().upper().replace(' ', '_'),
+    'tal_cual': lambda c: c,
+}
+
+# --- Esquemas por entrada ---
+# columnas: destino → {origen, tipo, [nulos], [defecto], [redondeo]}
+# obligatorias: columnas destino que no pueden quedar vacías (la fila se descarta)
+# estricto: un valor no convertible detiene la carga en lugar de vaciarse
+
+FINANCE_MES = {
+    'cabecera': 'snake',
+    'columnas': {
+        'SAP': {'origen': 'sap_code', 'tipo': 'texto'},
+        'NUMERO_SAP_VENDEDOR': {'origen': 'salesperson_no', 'tipo': 'numero', 'defecto': 0},
+        'IMPORTE_FINANCIADO': {'origen': 'amount', 'tipo': 'decimal_es'},
+        'AÑO': {'origen': 'year', 'tipo': 'numero'},
+        'MES': {'origen': 'month', 'tipo': 'numero'},
+        'NUM_OPERACIONES': {'origen': 'operations', 'tipo': 'numero'},
+    },
+    'obligatorias': ['SAP', 'IMPORTE_FINANCIADO', 'AÑO', 'MES', 'NUM_OPERACIONES'],
+}
+
+OBJETIVOS = {
+    'cabecera': 'upper_snake',
+    'columnas': {
+        'TRC_OBJETIVO': {'origen': 'TRC_OBJETIVO', 'tipo': 'porcentaje', 'redondeo': 4},
+    },
+    'obligatorias': [],
+    'estricto': True,
+}
+
+PRODUCCION = {
+    'cabecera': 'tal_cual',
+    'columnas': {
+        'fecha': {'origen': 'fecha', 'tipo': 'fecha'},
+        'Codigo_Tienda': {'origen': 'Codigo Tienda', 'tipo': 'texto', 'defecto': ''},
+        'produccion_rentable': {'origen': 'Producción Rentable', 'tipo': 'decimal', 'defecto': 0, 'redondeo': 2},
+        'Ventas_Venta_Gross': {'origen': 'Ventas_Venta_gross', 'tipo': 'decimal', 'defecto': 0, 'redondeo': 2},
+    },
+    'obligatorias': ['fecha'],
+}
+
+
+def source_columns(schema):
+    """Columnas del archivo (ya normalizadas) que necesita el esquema."""
+    return [spec['origen'] for spec in schema['columnas'].values()]
+
+
+def normalize_header(schema, columns):
+    return [CABECERAS[schema.get('cabecera', 'tal_cual')](c) for c in columns]
+
+
+def _text_mask(raw):
+    """Máscara de los valores que son texto (los números de Excel no pasan por la limpieza de separadores)."""
+    tipo = infer_dtype(raw, skipna=True)
+    if tipo in ('string', 'empty'):
+        return raw.notna().to_numpy()
+    return raw.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+
+
+def parse_column(raw, spec):
+    """
+    Convierte una columna en una sola pasada según su especificación.
+    Devuelve (valores, máscara de valores no vacíos que no se pudieron convertir).
+    """
+    tipo = spec['tipo']
+    nulos = spec.get('nulos', NULOS)
+
+    if tipo == 'texto':
+        valores = raw.astype(object).where(raw.notna(), None)
+        if 'defecto' in spec:
+            valores = valores.fillna(spec['defecto'])
+        es_texto = valores.notna()
+        valores[es_texto] = valores[es_texto].astype(str)
+        return valores, np.zeros(len(raw), dtype=bool)
+
+    if is_numeric_dtype(raw) or is_datetime64_any_dtype(raw):
+        vacio = raw.isna().to_numpy()
+        origen = raw
+    else:
+        es_texto = _text_mask(raw)
+        texto = raw[es_texto].astype(str).str.strip()
+        vacio_texto = texto.isin(nulos).to_numpy()
+        tabla = _TRADUCCIONES.get(tipo)
+        if tabla is not None:
+            texto = texto.str.translate(tabla)
+        origen = raw.astype(object).copy()
+        origen[es_texto] = texto.where(~vacio_texto, None)
+        vacio = raw.isna().to_numpy().copy()
+        vacio[np.flatnonzero(es_texto)[vacio_texto]] = True
+
+    if tipo == 'fecha':
+        valores = pd.to_datetime(origen, errors='coerce')
+    else:
+        valores = pd.to_numeric(origen, errors='coerce')
+    invalidos = valores.isna().to_numpy() & ~vacio
+
+    if 'redondeo' in spec:
+        valores = valores.round(spec['redondeo'])
+    if 'defecto' in spec:
+        valores = valores.fillna(spec['defecto'])
+    return valores, invalidos
+
+
+def new_report(schema):
+    """Informe de rechazos acumulable entre bloques."""
+    return {
+        'total': 0,
+        'descartados': 0,
+        'nulos': {col: 0 for col in schema['obligatorias']},
+        'invalidos': {col: 0 for col in schema['columnas']},
+        'ejemplos': {col: [] for col in schema['columnas']},
+    }
+
+
+def parse_frame(df, schema, report=None, nombre=""):
+    """
+    Aplica el esquema a un DataFrame con las cabeceras ya normalizadas: convierte cada
+    columna una vez, descarta las filas sin columnas obligatorias y acumula en `report`
+    los valores vacíos/no convertibles por columna (con algunos ejemplos).
+    Devuelve (DataFrame tipado con las columnas destino, report).
+    """
+    report = report if report is not None else new_report(schema)
+    faltan = [c for c in source_columns(schema) if c not in df.columns]
+    if faltan:
+        raise ValueError(f"❌ Faltan columnas en el archivo {nombre}: {faltan}")
+
+    salida = {}
+    for destino, spec in schema['columnas'].items():
+        raw = df[spec['origen']]
+        valores, invalidos = parse_column(raw, spec)
+        if invalidos.any():
+            report['invalidos'][destino] += int(invalidos.sum())
+            ejemplos = report['ejemplos'][destino]
+            if len(ejemplos) < 5:
+                ejemplos.extend(raw[invalidos].head(5 - len(ejemplos)).tolist())
+        salida[destino] = valores
+    typed = pd.DataFrame(salida, index=df.index)
+
+    if schema.get('estricto') and any(report['invalidos'].values()):
+        print_report(report)
+        raise ValueError(f"❌ Valores no convertibles en el archivo {nombre}.")
+
+    for col in schema['obligatorias']:
+        report['nulos'][col] += int(typed[col].isna().sum())
+    original_len = len(typed)
+    if schema['obligatorias']:
+        typed = typed.dropna(subset=schema['obligatorias'])
+    report['total'] += original_len
+    report['descartados'] += original_len - len(typed)
+    return typed, report
+
+
+def print_report(report):
+    for campo, invalidos in report['invalidos'].items():
+        if invalidos > 0:
+            print(f"⚠️ {invalidos} valores no convertibles en {campo} (ej.: {report['ejemplos'][campo]})")
+    for campo, nulos in report['nulos'].items():
+        if nulos > 0:
+            print(f"⚠️ {nulos} registros con valor nulo en {campo}")
+    if report['descartados'] > 0:
+        print(f"⚠️ {report['descartados']} registros descartados por valores inválidos.")
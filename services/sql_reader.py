@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import DB_FETCH_ARRAYSIZE
+
+
+def iter_chunks(cursor, sql, params=(), arraysize=None):
+    """Ejecuta la consulta y entrega las filas en bloques de `arraysize` (fetchmany)."""
+    arraysize = arraysize or DB_FETCH_ARRAYSIZE
+    cursor.arraysize = arraysize
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(arraysize)
+        if not rows:
+            break
+        yield rows
+
+
+def _report(nombre, filas, inicio):
+    segundos = time.perf_counter() - inicio
+    ritmo = filas / segundos if segundos > 0 else float("inf")
+    print(f"📥 {nombre or 'Lectura'}: {filas} filas en {segundos:.2f}s ({ritmo:,.0f} filas/s)")
+
+
+def fetch_columns(cursor, sql, params=(), arraysize=None, typed=True, nombre=""):
+    """
+    Lee el resultado por columnas: {columna: valores}. Cada bloque se traspone con
+    zip(*rows) y se añade a la lista de su columna, sin crear un dict por fila.
+    Con typed=True cada columna se convierte a un array numpy con el tipo inferido
+    por pandas (enteros, float, datetime64...); con typed=False quedan listas Python.
+    """
+    inicio = time.perf_counter()
+    valores = None
+    filas = 0
+    for rows in iter_chunks(cursor, sql, params, arraysize):
+        if valores is None:
+            valores = [[] for _ in cursor.description]
+        for columna, bloque in zip(valores, zip(*rows)):
+            columna.extend(bloque)
+        filas += len(rows)
+
+    nombres = [d[0] for d in cursor.description]
+    if valores is None:
+        valores = [[] for _ in nombres]
+    if typed:
+        valores = [pd.Series(v, dtype=None if v else object).infer_objects().to_numpy() for v in valores]
+    _report(nombre, filas, inicio)
+    return dict(zip(nombres, valores))
+
+
+def fetch_frame(cursor, sql, params=(), arraysize=None, nombre=""):
+    """Resultado de la consulta como DataFrame (con las columnas aunque venga vacío)."""
+    return pd.DataFrame(fetch_columns(cursor, sql, params, arraysize, nombre=nombre))
+
+
+def fetch_set(cursor, sql, params=(), arraysize=None, nombre=""):
+    """
+    Set de los valores de la consulta: de la única columna o de tuplas si hay varias.
+    Se alimenta bloque a bloque, sin guardar el resultado completo.
+    """
+    inicio = time.perf_counter()
+    valores = set()
+    filas = 0
+    for rows in iter_chunks(cursor, sql, params, arraysize):
+        if len(cursor.description) == 1:
+            valores.update(next(zip(*rows)))
+        else:
+            valores.update(map(tuple, rows))
+        filas += len(rows)
+    _report(nombre, filas, inicio)
+    return valores
+
+
+def fetch_hashes(cursor, sql, params=(), hasher=None, arraysize=None, nombre=""):
+    """
+    Índice de hashes del resultado: cada bloque se convierte en DataFrame, se pasa por
+    `hasher` (por defecto hash_pandas_object de la fila) y se descarta, así que en
+    memoria solo quedan los hashes (p. ej. para un HashedKeyStore).
+    """
+    if hasher is None:
+        def hasher(df):
+            return pd.util.hash_pandas_object(df, index=False).to_numpy(np.uint64)
+
+    inicio = time.perf_counter()
+    partes = []
+    filas = 0
+    for rows in iter_chunks(cursor, sql, params, arraysize):
+        nombres = [d[0] for d in cursor.description]
+        partes.append(hasher(pd.DataFrame(dict(zip(nombres, zip(*rows))))))
+        filas += len(rows)
+    _report(nombre, filas, inicio)
+    if not partes:
+        return None
+    return np.concatenate(partes)
@@ -0,0 +1,56 @@
+import time
+
+from config import DB_TARGET_LATENCY
+
+
+class ThroughputController:
+    """
+    Ajusta el tamaño de lote según la latencia medida de cada lote (envío + commit).
+
+    - Mientras la latencia está por debajo del objetivo, el lote crece y no se pausa.
+    - Si la latencia supera el objetivo, el lote se reduce en proporción y se
+      introduce una pausa equivalente al exceso (acotada por max_pause), para no
+      saturar el SQL Server compartido.
+    """
+
+    def __init__(self, target_latency=DB_TARGET_LATENCY, batch_size=1000, min_batch=100,
+                 max_batch=20000, growth=1.5, max_pause=10.0):
+        self.target_latency = target_latency
+        self.batch_size = batch_size
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.growth = growth
+        self.max_pause = max_pause
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.paused_seconds = 0.0
+
+    def record(self, rows, seconds):
+        """Registra un lote y devuelve los segundos de pausa recomendados antes del siguiente."""
+        self.rows += rows
+        self.busy_seconds += seconds
+        previous = self.batch_size
+
+        if seconds <= self.target_latency:
+            self.batch_size = min(self.max_batch, int(self.batch_size * self.growth))
+            pause = 0.0
+        else:
+            ratio = self.target_latency / seconds
+            self.batch_size = max(self.min_batch, int(self.batch_size * ratio))
+            pause = min(self.max_pause, seconds - self.target_latency)
+
+        rate = rows / seconds if seconds > 0 else float("inf")
+        if self.batch_size != previous or pause > 0:
+            print(f"🎚️ Lote de {rows} en {seconds:.2f}s ({rate:,.0f} filas/s) → "
+                  f"siguiente lote: {self.batch_size}" + (f", pausa {pause:.1f}s" if pause > 0 else ""))
+        return pause
+
+    def wait(self, pause):
+        if pause > 0:
+            self.paused_seconds += pause
+            time.sleep(pause)
+
+    def rows_per_second(self):
+        """Filas/s efectivas incluyendo las pausas introducidas."""
+        elapsed = self.busy_seconds + self.paused_seconds
+        return self.rows / elapsed if elapsed > 0 else 0.0
@@ -0,0 +1,104 @@
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Filas por bloque entregado
+BATCH_SIZE = 50_000
+
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def is_xlsx(path):
+    """Solo los .xlsx/.xlsm se pueden leer en streaming; los .xls siguen yendo por pandas."""
+    return os.path.splitext(path)[1].lower() in XLSX_EXTENSIONS
+
+
+def sheet_names(path):
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def _convert(value, as_str):
+    """Convierte una celda igual que pd.read_excel (y dtype=str si as_str)."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if as_str and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def _header_names(header):
+    return [
+        f"Unnamed: {i}" if h is None else (str(_convert(h, False)) if not isinstance(h, str) else h)
+        for i, h in enumerate(header)
+    ]
+
+
+def iter_xlsx_batches(path, columns=None, sheet_name=None, batch_size=BATCH_SIZE,
+                      header_transform=None, as_str=False):
+    """
+    Lee un .xlsx en modo read-only/values-only de openpyxl, sin construir el modelo
+    completo del libro, y genera DataFrames de como mucho `batch_size` filas.
+
+    - columns: nombres (tras header_transform) de las columnas a leer; None = todas.
+    - sheet_name: hoja a leer; None = la primera.
+    - header_transform: función aplicada a los nombres de cabecera antes de buscar `columns`.
+    - as_str: devuelve los valores como texto, igual que pd.read_excel(dtype=str).
+
+    Las filas completamente vacías se omiten.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name is not None else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = _header_names(header)
+        if header_transform is not None:
+            names = [header_transform(n) for n in names]
+
+        if columns is None:
+            selected = list(enumerate(names))
+        else:
+            missing = [c for c in columns if c not in names]
+            if missing:
+                raise ValueError(f"❌ Faltan columnas en el archivo {os.path.basename(path)}: {missing}")
+            selected = [(names.index(c), c) for c in columns]
+
+        batch = {name: [] for _, name in selected}
+        n = 0
+        entregados = 0
+        for row in rows:
+            if not any(v is not None for v in row):
+                continue
+            width = len(row)
+            for idx, name in selected:
+                batch[name].append(_convert(row[idx], as_str) if idx < width else None)
+            n += 1
+            if n == batch_size:
+                yield pd.DataFrame(batch)
+                entregados += 1
+                batch = {name: [] for _, name in selected}
+                n = 0
+        if n or not entregados:
+            yield pd.DataFrame(batch)
+    finally:
+        wb.close()
+
+
+def read_xlsx(path, columns=None, sheet_name=None, header_transform=None, as_str=False):
+    """Lee el .xlsx completo por bloques (ver iter_xlsx_batches) y devuelve un único DataFrame."""
+    batches = list(iter_xlsx_batches(path, columns=columns, sheet_name=sheet_name,
+                                     header_transform=header_transform, as_str=as_str))
+    if not batches:
+        return pd.DataFrame(columns=columns or [])
+    if len(batches) == 1:
+        return batches[0]
+    return pd.concat(batches, ignore_index=True)
@@ -0,0 +1,79 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import comisiones
+
+REGLAS = [
+    {"desde": date(2020, 1, 1), "hasta": date(2021, 1, 1), "cod_vend": 0.20},
+    {"desde": date(2021, 6, 1), "hasta": None, "cod_vend": 0.40},
+]
+
+
+@pytest.fixture
+def tabla(monkeypatch):
+    monkeypatch.setitem(comisiones.REGLAS_REPARTO, "Prueba", REGLAS)
+    return "Prueba"
+
+
+def test_tasa_segun_vigencia(tabla):
+    tasas = comisiones.tasa_cod_vend(tabla, ["2020-05-01", "2021-06-01", "2030-01-01"])
+    assert tasas.tolist() == [0.20, 0.40, 0.40]
+
+
+@pytest.mark.parametrize("fecha", ["2021-01-01", "2021-03-15", "2019-12-31", None, "no es fecha"])
+def test_fecha_sin_regla_detiene_la_carga(tabla, fecha):
+    # Tras el fin de una regla cerrada, en un hueco, antes de la primera, nula o no convertible
+    with pytest.raises(ValueError):
+        comisiones.tasa_cod_vend(tabla, ["2020-05-01", fecha])
+
+
+def test_tasa_coincide_con_tramos(tabla):
+    fechas = [date(2020, 3, 1), date(2020, 12, 31), date(2021, 6, 1), date(2024, 1, 1)]
+    tramos = comisiones.tramos(tabla, date(2019, 1, 1), date(2025, 1, 1))
+    esperadas = [next(t for i, f, t in tramos if i <= d < f) for d in fechas]
+    assert comisiones.tasa_cod_vend(tabla, fechas).tolist() == esperadas
+
+
+def _desdoblar_anterior(df):
+    """Implementación previa (copia + concat + sort), referencia de la salida esperada."""
+    df['IMPORTE_NUMERICO'] = df['IMPORTE']
+    cod_rows = df.copy()
+    cod_rows['FUENTE'] = 'COD_VEND'
+    cod_rows['IMPORTE'] = cod_rows['com_COD_VEND']
+    cod_rows['VENDEDOR'] = cod_rows['COD_VEND']
+    firma_rows = df.copy()
+    firma_rows['FUENTE'] = 'VEND_FIRMA'
+    firma_rows['IMPORTE'] = firma_rows['com_VEND_FIRMA']
+    firma_rows['VENDEDOR'] = firma_rows['VEND_FIRMA']
+    df_final = pd.concat([cod_rows, firma_rows], ignore_index=True)
+    df_final['numPersonal'] = df_final['VENDEDOR']
+    df_final['indice'] = df_final['SAP'] + df_final['VENDEDOR']
+    df_final = df_final.drop(columns=[
+        'COD_VEND', 'VEND_FIRMA', 'com_COD_VEND', 'com_VEND_FIRMA', 'KPI', 'AÑO', 'MES', 'NOMBRE'
+    ], errors='ignore')
+    return df_final.sort_values(by=['guid', 'FUENTE']).reset_index(drop=True)
+
+
+def test_desdoblar_igual_que_la_version_anterior():
+    df = pd.DataFrame({
+        'FECHA_ALTA': ['2024-03-01', '2024-03-02', '2024-03-03', '2024-03-04', '2024-03-05'],
+        'SAP': ['T1', np.nan, 'T3', 'T4', 'T5'],
+        'COD_VEND': ['100', '200', '300', '400', '500'],
+        # Vacío y '0' sin corregir, y ya corregidos a COD_VEND (lo que deja fix_vend_firma)
+        'VEND_FIRMA': ['', '0', '300', '401', '500'],
+        'IMPORTE': ['10.5', '20', 'x', '7.77', '0'],
+        'NUM_OPERACIONES': [1, 2, 3, 4, 5],
+        'KPI': ['k'] * 5, 'AÑO': [2024] * 5, 'MES': [3] * 5, 'NOMBRE': ['n'] * 5,
+        'guid': ['e5', 'a1', 'c3', 'b2', 'd4'],
+    })
+    df = comisiones.fix_comisiones(df, "Datos_Normalizados")
+
+    esperado = _desdoblar_anterior(df.copy())
+    nuevo = comisiones.desdoblar_comisiones(df.copy())
+    nuevo = nuevo.sort_values(by=['guid', 'FUENTE']).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(nuevo, esperado)
+    assert nuevo.loc[nuevo['guid'] == 'a1', 'indice'].isna().all()
@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+from services.deduplication import (
+    FINANCE_MES_TABLE, ensure_dedup_index, insert_new_records_server_side, verify_existing_server_side,
+)
+from services.file_reader import read_file
+
+CSV = """sap_code;salesperson_no;amount;year;month;operations
+T001;1001;1.234,50;2024;1;3
+T001;1002;99,90;2024;1;1
+T002;;500,00;2024;2;2
+"""
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    # La caché de lecturas (PARSE_CACHE_DIR) es relativa: que quede dentro de tmp_path
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ':memory:' AS dbo")
+    conn.execute(f"""
+        CREATE TABLE {FINANCE_MES_TABLE} (
+            FECHA_ALTA DATETIME, SAP TEXT, NUMERO_SAP_VENDEDOR INT, IMPORTE_FINANCIADO REAL,
+            AÑO INT, MES INT, NUM_OPERACIONES INT
+        )
+    """)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def records(tmp_path):
+    path = tmp_path / "finance_mes.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return read_file(str(path))
+
+
+def test_segunda_carga_no_inserta(conn, records):
+    columns = list(records.columns)
+    ensure_dedup_index(conn)
+    assert insert_new_records_server_side(records, conn, columns) == len(records)
+
+    ensure_dedup_index(conn)
+    assert insert_new_records_server_side(records, conn, columns) == 0
+    assert conn.execute(f"SELECT COUNT(*) FROM {FINANCE_MES_TABLE}").fetchone()[0] == len(records)
+
+
+def test_verificacion_en_servidor(conn, records):
+    assert not verify_existing_server_side(records, conn).any()
+    insert_new_records_server_side(records, conn, list(records.columns))
+    assert verify_existing_server_side(records, conn).all()